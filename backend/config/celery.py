@@ -1,8 +1,20 @@
 import os
 from celery import Celery
 
+from config.task_metrics import connect_task_metrics
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
+# Планирование рассылок и доставка в Telegram идут через разные очереди: всплеск доставки
+# не задерживает ежеминутные задачи beat, а воркеры доставки масштабируются отдельно
+SCHEDULING_QUEUE = "scheduling"
+DELIVERY_QUEUE = "delivery"
+
 app = Celery("config")
 app.config_from_object("django.conf:settings", namespace="CELERY")
+app.conf.task_routes = {
+    "habits.tasks.send_*": {"queue": DELIVERY_QUEUE},
+    "habits.tasks.*": {"queue": SCHEDULING_QUEUE},
+}
 app.autodiscover_tasks()
+connect_task_metrics(app, queues=(app.conf.task_default_queue, SCHEDULING_QUEUE, DELIVERY_QUEUE))
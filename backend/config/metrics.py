@@ -0,0 +1,140 @@
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connection
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LABELS = ("view", "method")
+# Остальные методы сводятся в одну метку, чтобы произвольные запросы не раздували число рядов
+METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"}
+UNMATCHED_VIEW = "unmatched"
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Время обработки запроса", LABELS)
+REQUESTS = Counter("http_requests_total", "Запросы по представлениям и кодам ответа", LABELS + ("status",))
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Размер тела ответа (без потоковых ответов)",
+    LABELS,
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Число SQL-запросов за запрос",
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_DURATION = Histogram("http_request_db_duration_seconds", "Время SQL-запросов за запрос", LABELS)
+
+
+class QueryTimer:
+    """Обёртка connection.execute_wrapper: считает запросы и время в БД в рамках одного HTTP-запроса."""
+
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def attach_query_timer(timer):
+    connection.execute_wrappers.append(timer)
+
+
+def detach_query_timer(timer):
+    connection.execute_wrappers.remove(timer)
+
+
+class ViewMetrics:
+    """Метрики с уже привязанными метками одного представления и метода."""
+
+    __slots__ = ("labels", "latency", "size", "queries", "db_duration", "statuses")
+
+    def __init__(self, view, method):
+        self.labels = (view, method)
+        self.latency = REQUEST_LATENCY.labels(view, method)
+        self.size = RESPONSE_SIZE.labels(view, method)
+        self.queries = DB_QUERIES.labels(view, method)
+        self.db_duration = DB_DURATION.labels(view, method)
+        self.statuses = {}
+
+    def observe(self, response, duration, timer):
+        self.latency.observe(duration)
+        self.queries.observe(timer.count)
+        self.db_duration.observe(timer.duration)
+        if not response.streaming:
+            self.size.observe(len(response.content))
+        counter = self.statuses.get(response.status_code)
+        if counter is None:
+            counter = self.statuses[response.status_code] = REQUESTS.labels(*self.labels, response.status_code)
+        counter.inc()
+
+
+class MetricsMiddleware:
+    """Время ответа, SQL-запросы, размер и код ответа по каждому представлению для /metrics."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.views = {}
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        # Соединения с БД свои у каждого потока: обёртка ставится в потоке, где sync_to_async выполняет запросы
+        timer = QueryTimer()
+        started = time.perf_counter()
+        await sync_to_async(attach_query_timer)(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(detach_query_timer)(timer)
+        self.observe(request, response, time.perf_counter() - started, timer)
+        return response
+
+    def observe(self, request, response, duration, timer):
+        match = request.resolver_match
+        view = match.view_name if match is not None else UNMATCHED_VIEW
+        method = request.method if request.method in METHODS else "other"
+        metrics = self.views.get((view, method))
+        if metrics is None:
+            metrics = self.views[(view, method)] = ViewMetrics(view, method)
+        metrics.observe(response, duration, timer)
+
+
+def metrics_view(request):
+    registry = REGISTRY
+    # Несколько воркеров gunicorn пишут метрики в общий каталог, их нужно собрать вместе
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "config.metrics.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -83,6 +84,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "config.wsgi.application"
 
+# SERVER_MODE=asgi: запуск через uvicorn-воркеры и асинхронные пути чтения привычек
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+ASYNC_READ_VIEWS = SERVER_MODE == "asgi"
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -109,6 +114,11 @@ else:
             "PASSWORD": clean_env_var(os.getenv("PASSWORD")) or "12345",
             "HOST": "localhost",
             "PORT": "5432",
+            # Постоянные соединения для gunicorn и Celery (фиксап Celery закрывает их по тем же правилам),
+            # перед переиспользованием соединение проверяется. Под ASGI запросы к БД идут из потоков
+            # sync_to_async, и постоянное соединение оставалось бы открытым на каждый такой поток
+            "CONN_MAX_AGE": 0 if SERVER_MODE == "asgi" else int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
         }
     }
 
@@ -161,8 +171,31 @@ CORS_ALLOWED_ORIGINS = [
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": ("rest_framework_simplejwt.authentication.JWTAuthentication",),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    "DEFAULT_THROTTLE_CLASSES": ("users.throttling.SlidingWindowRateThrottle",),
+    # Запросов за период (s, m, h, d) на пользователя, для анонимных запросов — на IP
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": os.getenv("THROTTLE_RATE_ANON", "60/m"),
+        "user": os.getenv("THROTTLE_RATE_USER", "600/m"),
+        "register": os.getenv("THROTTLE_RATE_REGISTER", "10/h"),
+        "token": os.getenv("THROTTLE_RATE_TOKEN", "20/m"),
+    },
+    # IP клиента берётся из X-Forwarded-For, который выставляет nginx
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", "1")),
+}
+
+if 'test' in sys.argv:
+    # Тесты не зависят от Redis; ограничение частоты проверяется отдельно на fakeredis
+    REST_FRAMEWORK["DEFAULT_THROTTLE_CLASSES"] = ()
+
+SIMPLE_JWT = {
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.ClaimsTokenObtainPairSerializer",
 }
 
+# Привычки аутентифицируются по claims токена без запроса пользователя к БД
+STATELESS_JWT_AUTH = os.getenv("STATELESS_JWT_AUTH", "true").lower() == "true"
+# Сколько секунд кэшируется проверка, что пользователь не отключён
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", "60"))
+
 AUTH_USER_MODEL = "users.CustomUser"
 
 MIDDLEWARE = ["corsheaders.middleware.CorsMiddleware"] + MIDDLEWARE
@@ -171,14 +204,81 @@ CELERY_BROKER_URL = os.getenv("REDIS_URL").strip()
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_TIMEZONE = "Europe/Moscow"
+# Хранилище результатов нужно для chord: итоги шардов рассылки собираются в одной задаче
+CELERY_RESULT_BACKEND = CELERY_BROKER_URL
+CELERY_RESULT_EXPIRES = 3600
+
+if 'test' in sys.argv:
+    CELERY_TASK_ALWAYS_EAGER = True
+    CELERY_TASK_EAGER_PROPAGATES = True
 
 CELERY_BEAT_SCHEDULE = {
-    "send-reminders-every-morning": {
-        "task": "habits.tasks.schedule_daily_reminders",
-        "schedule": crontab(hour=8, minute=0),
+    "dispatch-reminders-every-minute": {
+        "task": "habits.tasks.dispatch_due_reminders",
+        "schedule": crontab(),
+    },
+    "retry-failed-reminders": {
+        "task": "habits.tasks.retry_failed_reminders",
+        "schedule": crontab(minute="*/10"),
+    },
+    # 03:15 по Москве — 00:15 UTC, когда день по TIME_ZONE уже закрыт
+    "rollup-habit-stats-daily": {
+        "task": "habits.tasks.rollup_habit_stats",
+        "schedule": crontab(hour=3, minute=15),
     },
 }
 
 REDIS_URL = os.getenv('REDIS_URL')
+
+THROTTLE_REDIS_URL = clean_env_var(os.getenv('THROTTLE_REDIS_URL') or REDIS_URL)
+# Таймаут Redis для проверки лимитов (с): при недоступности Redis запросы пропускаются
+THROTTLE_REDIS_TIMEOUT = float(os.getenv('THROTTLE_REDIS_TIMEOUT', '0.1'))
+
+if 'test' in sys.argv:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": clean_env_var(REDIS_URL),
+        }
+    }
+
+# Максимальное число привычек в одном bulk-запросе
+HABIT_BULK_MAX_ITEMS = int(os.getenv('HABIT_BULK_MAX_ITEMS', '500'))
+
+# Время жизни закэшированных страниц публичной ленты (секунды)
+PUBLIC_FEED_CACHE_TIMEOUT = int(os.getenv('PUBLIC_FEED_CACHE_TIMEOUT', '300'))
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL') or None
+
+# Лимиты отправки в Telegram (сообщений в секунду), общие для всех воркеров: ведра хранятся в Redis.
+# Без TELEGRAM_RATE_LIMIT_REDIS_URL и REDIS_URL лимиты действуют на каждый процесс воркера отдельно.
+TELEGRAM_RATE_LIMIT_REDIS_URL = clean_env_var(os.getenv('TELEGRAM_RATE_LIMIT_REDIS_URL') or REDIS_URL)
+TELEGRAM_RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv('TELEGRAM_RATE_LIMIT_REDIS_TIMEOUT', '0.5'))
+TELEGRAM_RATE_LIMIT = float(os.getenv('TELEGRAM_RATE_LIMIT', '30'))
+TELEGRAM_CHAT_RATE_LIMIT = float(os.getenv('TELEGRAM_CHAT_RATE_LIMIT', '1'))
+TELEGRAM_MAX_CONCURRENCY = int(os.getenv('TELEGRAM_MAX_CONCURRENCY', '8'))
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))
+
+# Сколько напоминаний отправляется одной задачей Celery
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', '500'))
+# На сколько минут назад ежеминутная рассылка подбирает пропущенные напоминания
+REMINDER_LOOKBACK_MINUTES = int(os.getenv('REMINDER_LOOKBACK_MINUTES', '15'))
+# На сколько задач по отрезкам id делится ежедневный просмотр привычек
+REMINDER_SHARDS = int(os.getenv('REMINDER_SHARDS', '8'))
+# Через сколько минут прерванная отправка считается потерянной и повторяется; напоминанию, ждущему в очереди,
+# к этому добавляется время разбора полной очереди доставки (см. habits.tasks.pending_timeout)
+REMINDER_PENDING_TIMEOUT_MINUTES = int(os.getenv('REMINDER_PENDING_TIMEOUT_MINUTES', '15'))
+# После скольких попыток отправки в Telegram напоминание больше не повторяется
+REMINDER_MAX_ATTEMPTS = int(os.getenv('REMINDER_MAX_ATTEMPTS', '10'))
+# Порог очереди доставки (в пачках), выше которого рассылка ждёт, пока воркеры её разгрузят
+REMINDER_QUEUE_MAX_LENGTH = int(os.getenv('REMINDER_QUEUE_MAX_LENGTH', '200'))
+# Как часто проверяется очередь и сколько секунд рассылка ждёт её разгрузки перед одной пачкой
+REMINDER_BACKPRESSURE_INTERVAL = float(os.getenv('REMINDER_BACKPRESSURE_INTERVAL', '2'))
+REMINDER_BACKPRESSURE_MAX_WAIT = float(os.getenv('REMINDER_BACKPRESSURE_MAX_WAIT', '300'))
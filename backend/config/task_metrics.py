@@ -0,0 +1,138 @@
+import functools
+import glob
+import os
+import time
+
+from celery import signals
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, multiprocess, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+# Время постановки в очередь передаётся заголовком сообщения; считается по часам продюсера
+ENQUEUED_AT_HEADER = "enqueued_at"
+
+TASK_QUEUE_LAG = Histogram(
+    "celery_task_queue_lag_seconds",
+    "Время от постановки задачи в очередь до начала выполнения",
+    ("task",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 30, 60, 300, 900),
+)
+TASK_RUNTIME = Histogram(
+    "celery_task_runtime_seconds",
+    "Время выполнения задачи",
+    ("task",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 30, 60, 300),
+)
+TASK_OUTCOMES = Counter(
+    "celery_task_outcomes_total",
+    "Завершённые задачи по итогу (SUCCESS, FAILURE, RETRY)",
+    ("task", "outcome"),
+)
+BACKPRESSURE_WAIT = Counter(
+    "celery_backpressure_wait_seconds_total",
+    "Сколько продюсер ждал, пока очередь разгрузится",
+    ("queue",),
+)
+
+
+class TaskMetrics:
+    """Метрики с уже привязанной меткой одной задачи."""
+
+    __slots__ = ("name", "lag", "runtime", "outcomes")
+
+    def __init__(self, name):
+        self.name = name
+        self.lag = TASK_QUEUE_LAG.labels(name)
+        self.runtime = TASK_RUNTIME.labels(name)
+        self.outcomes = {}
+
+    def outcome(self, state):
+        counter = self.outcomes.get(state)
+        if counter is None:
+            counter = self.outcomes[state] = TASK_OUTCOMES.labels(self.name, state)
+        return counter
+
+
+task_metrics = {}
+
+
+def get_task_metrics(name):
+    metrics = task_metrics.get(name)
+    if metrics is None:
+        metrics = task_metrics[name] = TaskMetrics(name)
+    return metrics
+
+
+def queue_length(app, queue):
+    """Число сообщений в очереди брокера (для Redis — длина списка)."""
+    with app.pool.acquire(block=True) as connection:
+        try:
+            return connection.default_channel.queue_declare(queue, passive=True).message_count
+        except connection.channel_errors:
+            # В Redis у пустой очереди нет ключа, и пассивное объявление отвечает NOT_FOUND
+            return 0
+
+
+class QueueLengthCollector:
+    """Длина очередей брокера на момент опроса метрик."""
+
+    def __init__(self, app, queues):
+        self.app = app
+        self.queues = queues
+
+    def describe(self):
+        return [GaugeMetricFamily("celery_queue_length", "Сообщений в очереди брокера", labels=["queue"])]
+
+    def collect(self):
+        family = GaugeMetricFamily("celery_queue_length", "Сообщений в очереди брокера", labels=["queue"])
+        for queue in self.queues:
+            family.add_metric([queue], queue_length(self.app, queue))
+        yield family
+
+
+def stamp_enqueue_time(headers=None, **kwargs):
+    if headers is not None:
+        headers[ENQUEUED_AT_HEADER] = time.time()
+
+
+def task_started(task=None, **kwargs):
+    metrics = get_task_metrics(task.name)
+    enqueued_at = task.request.get(ENQUEUED_AT_HEADER)
+    if enqueued_at is not None:
+        metrics.lag.observe(max(0.0, time.time() - enqueued_at))
+    task.request.metrics_started = time.perf_counter()
+
+
+def task_finished(task=None, state=None, **kwargs):
+    metrics = get_task_metrics(task.name)
+    started = task.request.get("metrics_started")
+    if started is not None:
+        metrics.runtime.observe(time.perf_counter() - started)
+    metrics.outcome(state or "UNKNOWN").inc()
+
+
+def start_metrics_server(app, queues, **kwargs):
+    """HTTP-сервер метрик воркера на CELERY_METRICS_PORT, формат тот же, что у /metrics веб-приложения.
+
+    Дочерние процессы prefork пишут метрики в PROMETHEUS_MULTIPROC_DIR, сервер в главном процессе их суммирует.
+    """
+    port = os.getenv("CELERY_METRICS_PORT")
+    if not port:
+        return
+    registry = REGISTRY
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        # Файлы прошлого запуска воркера иначе попадут в суммы счётчиков
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, "*.db")):
+            os.remove(path)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, multiproc_dir)
+    registry.register(QueueLengthCollector(app, queues))
+    start_http_server(int(port), registry=registry)
+
+
+def connect_task_metrics(app, queues):
+    signals.before_task_publish.connect(stamp_enqueue_time, weak=False)
+    signals.task_prerun.connect(task_started, weak=False)
+    signals.task_postrun.connect(task_finished, weak=False)
+    signals.worker_init.connect(functools.partial(start_metrics_server, app, queues), weak=False)
@@ -0,0 +1,165 @@
+from unittest import mock
+
+import fakeredis
+from asgiref.sync import sync_to_async
+from celery.app.task import Context
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from kombu import Connection
+from kombu.transport import redis as kombu_redis
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from habits.tasks import rollup_habit_stats, send_reminder_batch
+from config.celery import app as celery_app
+from config.task_metrics import QueueLengthCollector, queue_length, stamp_enqueue_time, task_started
+
+
+User = get_user_model()
+
+
+class MetricsMiddlewareTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    @staticmethod
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_is_counted_with_queries_and_size(self):
+        labels = {"view": "habits-list", "method": "GET"}
+        requests_before = self.sample("http_requests_total", status="200", **labels)
+        latency_before = self.sample("http_request_duration_seconds_count", **labels)
+        queries_before = self.sample("http_request_db_queries_sum", **labels)
+        size_before = self.sample("http_response_size_bytes_sum", **labels)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("habits-list"))
+
+        self.assertEqual(self.sample("http_requests_total", status="200", **labels), requests_before + 1)
+        self.assertEqual(self.sample("http_request_duration_seconds_count", **labels), latency_before + 1)
+        self.assertEqual(self.sample("http_request_db_queries_sum", **labels), queries_before + len(queries))
+        self.assertEqual(self.sample("http_response_size_bytes_sum", **labels), size_before + len(response.content))
+
+    async def test_asgi_requests_are_counted(self):
+        labels = {"view": "habits-list", "method": "GET"}
+        requests_before = self.sample("http_requests_total", status="200", **labels)
+        queries_before = self.sample("http_request_db_queries_sum", **labels)
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+
+        response = await AsyncClient().get(reverse("habits-list"), headers={"Authorization": f"Bearer {token}"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sample("http_requests_total", status="200", **labels), requests_before + 1)
+        self.assertGreater(self.sample("http_request_db_queries_sum", **labels), queries_before)
+
+    def test_status_codes_are_separate_series(self):
+        labels = {"view": "habits-list", "method": "GET", "status": "401"}
+        before = self.sample("http_requests_total", **labels)
+
+        self.client.credentials()
+        self.assertEqual(self.client.get(reverse("habits-list")).status_code, 401)
+
+        self.assertEqual(self.sample("http_requests_total", **labels), before + 1)
+
+    def test_unknown_routes_share_one_label(self):
+        labels = {"view": "unmatched", "method": "GET", "status": "404"}
+        before = self.sample("http_requests_total", **labels)
+
+        self.client.get("/no-such-page/1/")
+        self.client.get("/no-such-page/2/")
+
+        self.assertEqual(self.sample("http_requests_total", **labels), before + 2)
+
+    def test_metrics_endpoint_exposes_counters(self):
+        self.client.get(reverse("habits-list"))
+
+        response = APIClient().get(reverse("metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('http_requests_total{method="GET",status="200",view="habits-list"}', body)
+        self.assertIn("http_request_db_duration_seconds_bucket", body)
+
+
+class CeleryTelemetryTestCase(TestCase):
+    @staticmethod
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_scheduling_and_delivery_use_separate_queues(self):
+        router = celery_app.amqp.router
+
+        self.assertEqual(router.route({}, "habits.tasks.send_reminder_batch")["queue"].name, "delivery")
+        self.assertEqual(router.route({}, "habits.tasks.send_telegram_reminder")["queue"].name, "delivery")
+        self.assertEqual(router.route({}, "habits.tasks.dispatch_reminder_shard")["queue"].name, "scheduling")
+        self.assertEqual(router.route({}, "habits.tasks.dispatch_due_reminders")["queue"].name, "scheduling")
+
+    def test_task_runtime_and_outcome_are_recorded(self):
+        task = "habits.tasks.rollup_habit_stats"
+        runtime_before = self.sample("celery_task_runtime_seconds_count", task=task)
+        success_before = self.sample("celery_task_outcomes_total", task=task, outcome="SUCCESS")
+
+        rollup_habit_stats.delay("2025-07-20")
+
+        self.assertEqual(self.sample("celery_task_runtime_seconds_count", task=task), runtime_before + 1)
+        self.assertEqual(self.sample("celery_task_outcomes_total", task=task, outcome="SUCCESS"), success_before + 1)
+
+    def test_failures_are_counted(self):
+        task = "habits.tasks.send_reminder_batch"
+        before = self.sample("celery_task_outcomes_total", task=task, outcome="FAILURE")
+
+        # Без проброса исключения, как в воркере
+        with mock.patch("habits.tasks.get_delivery", side_effect=RuntimeError("boom")):
+            result = send_reminder_batch.apply(args=([[1, "100", "text"]],), throw=False)
+
+        self.assertTrue(result.failed())
+
+        self.assertEqual(self.sample("celery_task_outcomes_total", task=task, outcome="FAILURE"), before + 1)
+
+    def test_queue_lag_is_measured_from_publish_header(self):
+        task = "habits.tasks.send_reminder_batch"
+        headers = {}
+        with mock.patch("config.task_metrics.time.time", return_value=1000.0):
+            stamp_enqueue_time(headers=headers)
+        before = self.sample("celery_task_queue_lag_seconds_sum", task=task)
+
+        fake_task = mock.Mock(request=Context(headers))
+        fake_task.name = task
+        with mock.patch("config.task_metrics.time.time", return_value=1002.5):
+            task_started(task=fake_task)
+
+        self.assertEqual(self.sample("celery_task_queue_lag_seconds_sum", task=task), before + 2.5)
+
+
+class QueueLengthTestCase(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeStrictRedis()
+        patch = mock.patch.object(kombu_redis.Channel, "_create_client", lambda channel, asynchronous=False: self.redis)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.app = mock.Mock()
+        self.app.pool.acquire.return_value = Connection("redis://localhost:6379/0")
+
+    def test_empty_queue_has_zero_length(self):
+        self.assertEqual(queue_length(self.app, "delivery"), 0)
+
+    def test_counts_messages(self):
+        self.redis.lpush("delivery", "a", "b")
+
+        self.assertEqual(queue_length(self.app, "delivery"), 2)
+
+    def test_collector_reports_empty_queues(self):
+        self.redis.lpush("delivery", "a")
+
+        family = next(QueueLengthCollector(self.app, ("scheduling", "delivery")).collect())
+
+        lengths = {sample.labels["queue"]: sample.value for sample in family.samples}
+        self.assertEqual(lengths, {"scheduling": 0, "delivery": 1})
@@ -0,0 +1,162 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from users.authentication import CachedTokenUserAuthentication
+
+from .models import Habit
+from .renderers import ORJSONRenderer
+from .serializers import HabitSerializer, habit_list_columns, serialize_habit_rows
+from .views import HabitPagination, HabitViewSet
+
+# Синхронные DRF-представления для всего, что не покрыто асинхронными путями чтения
+sync_habit_list = sync_to_async(HabitViewSet.as_view({"get": "list", "post": "create"}))
+sync_habit_detail = sync_to_async(
+    HabitViewSet.as_view(
+        {"get": "retrieve", "put": "update", "patch": "partial_update", "delete": "destroy"}
+    )
+)
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if settings.STATELESS_JWT_AUTH:
+            return await sync_to_async(CachedTokenUserAuthentication().get_user)(validated_token)
+        if jwt_settings.CHECK_REVOKE_TOKEN:
+            return await sync_to_async(self.get_user)(validated_token)
+
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise exceptions.AuthenticationFailed("Token contained no recognizable user identification")
+        user = await self.user_model.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).afirst()
+        if user is None:
+            raise exceptions.AuthenticationFailed("User not found", code="user_not_found")
+        if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise exceptions.AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
+
+
+def render(data, status=200, headers=None):
+    return HttpResponse(ORJSONRenderer().render(data), status=status, content_type="application/json", headers=headers)
+
+
+async def authenticate(request):
+    authenticator = AsyncJWTAuthentication()
+    try:
+        user = await authenticator.aauthenticate(request)
+    except exceptions.APIException as e:
+        detail = e.detail if isinstance(e.detail, dict) else {"detail": e.detail}
+        return None, render(detail, 401, {"WWW-Authenticate": authenticator.authenticate_header(request)})
+    if user is None:
+        detail = {"detail": exceptions.NotAuthenticated.default_detail}
+        return None, render(detail, 401, {"WWW-Authenticate": authenticator.authenticate_header(request)})
+    return user, None
+
+
+async def check_throttles(request, user):
+    """Лимиты HabitViewSet для асинхронных путей чтения: DRF-представление здесь не вызывается и их не проверяет.
+
+    Возвращает ответ 429, если запрос не прошёл хотя бы один лимит, иначе None.
+    """
+    request.user = user
+    view = HabitViewSet()
+    waits = []
+    for throttle in view.get_throttles():
+        # Проверка лимита — запрос в Redis, а не в БД: держать её в общем потоке sync_to_async незачем
+        if not await sync_to_async(throttle.allow_request, thread_sensitive=False)(request, view):
+            waits.append(throttle.wait())
+    if not waits:
+        return None
+    waits = [wait for wait in waits if wait is not None]
+    exc = exceptions.Throttled(max(waits) if waits else None)
+    headers = {"Retry-After": "%d" % exc.wait} if exc.wait else None
+    return render({"detail": exc.detail}, exc.status_code, headers)
+
+
+def is_async_list(request):
+    params = request.GET
+    return (
+        request.method == "GET"
+        and params.get("public") != "true"
+        and params.get("pagination") != "cursor"
+        and "cursor" not in params
+        and "expand" not in params
+    )
+
+
+@csrf_exempt
+async def habit_list(request):
+    """Асинхронный список своих привычек с той же постраничной пагинацией, что и HabitViewSet.list."""
+    if not is_async_list(request):
+        return await sync_habit_list(request)
+
+    user, error_response = await authenticate(request)
+    if error_response:
+        return error_response
+    throttled_response = await check_throttles(request, user)
+    if throttled_response:
+        return throttled_response
+
+    page_size = HabitPagination.page_size
+    try:
+        page_number = int(request.GET.get(HabitPagination.page_query_param, 1))
+    except ValueError:
+        page_number = 0
+    queryset = Habit.objects.filter(user_id=user.id).order_by("id").values(*habit_list_columns())
+    count = await queryset.acount()
+    last_page = max(1, -(-count // page_size))
+    if not 1 <= page_number <= last_page:
+        return render({"detail": "Invalid page."}, 404)
+
+    offset = (page_number - 1) * page_size
+    rows = [row async for row in queryset[offset:offset + page_size]]
+    url = request.build_absolute_uri()
+    page_param = HabitPagination.page_query_param
+    next_url = replace_query_param(url, page_param, page_number + 1) if page_number < last_page else None
+    if page_number == 1:
+        previous_url = None
+    elif page_number == 2:
+        previous_url = remove_query_param(url, page_param)
+    else:
+        previous_url = replace_query_param(url, page_param, page_number - 1)
+    return render(
+        {
+            "count": count,
+            "next": next_url,
+            "previous": previous_url,
+            "results": serialize_habit_rows(rows),
+        }
+    )
+
+
+@csrf_exempt
+async def habit_detail(request, pk):
+    """Асинхронное чтение одной привычки; изменения обрабатывает HabitViewSet."""
+    if request.method != "GET":
+        return await sync_habit_detail(request, pk=pk)
+
+    user, error_response = await authenticate(request)
+    if error_response:
+        return error_response
+    throttled_response = await check_throttles(request, user)
+    if throttled_response:
+        return throttled_response
+
+    habit = await Habit.objects.filter(pk=pk).select_related("user").afirst()
+    if habit is None:
+        return render({"detail": "No Habit matches the given query."}, 404)
+    if not (habit.is_public or habit.user_id == user.id):
+        return render({"detail": exceptions.PermissionDenied.default_detail}, 403)
+    return render(HabitSerializer(habit).data)
@@ -0,0 +1,52 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+PUBLIC_FEED_VERSION_KEY = "habits:public_feed:version"
+# Полночь в любом часовом поясе приходится на границу 15 минут UTC
+CALENDAR_SLOT_SECONDS = 15 * 60
+
+
+def public_feed_version():
+    version = cache.get(PUBLIC_FEED_VERSION_KEY)
+    if version is None:
+        # Начальная версия из времени, чтобы после потери ключа не переиспользовать старые страницы
+        cache.add(PUBLIC_FEED_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(PUBLIC_FEED_VERSION_KEY)
+    return version
+
+
+def bump_public_feed_version():
+    try:
+        cache.incr(PUBLIC_FEED_VERSION_KEY)
+    except ValueError:
+        cache.add(PUBLIC_FEED_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def public_feed_state():
+    """Версия ленты вместе с текущим 15-минутным отрезком UTC для ETag и ключа кэша.
+
+    current_streak зависит от сегодняшней даты владельца, а серия прерывается без изменений в БД:
+    после полуночи в любом поясе страница и ETag должны смениться, хотя версию никто не увеличивал.
+    """
+    return f"{public_feed_version()}:{int(timezone.now().timestamp()) // CALENDAR_SLOT_SECONDS}"
+
+
+def public_feed_etag(version, uri):
+    digest = hashlib.md5(f"{version}:{uri}".encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def public_feed_cache_key(version, uri):
+    return f"habits:public_feed:{version}:{hashlib.md5(uri.encode()).hexdigest()}"
+
+
+def get_public_feed_page(version, uri):
+    return cache.get(public_feed_cache_key(version, uri))
+
+
+def set_public_feed_page(version, uri, data):
+    cache.set(public_feed_cache_key(version, uri), data, settings.PUBLIC_FEED_CACHE_TIMEOUT)
@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import redis
+import telegram
+from django.conf import settings
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.utils.request import Request
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Забирает токен (уходя в долг при необходимости) и возвращает время ожидания в секундах."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            self.sleep(wait)
+
+
+# KEYS[1] — ведро; ARGV: текущее время (мс), скорость (токенов в секунду), ёмкость.
+# Забирает токен (уходя в долг при необходимости) и возвращает, сколько миллисекунд ждать до его появления.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+if now > updated then
+    tokens = math.min(capacity, tokens + (now - updated) * rate / 1000)
+    updated = now
+end
+tokens = tokens - 1
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", updated)
+redis.call("PEXPIRE", KEYS[1], math.ceil((capacity - tokens) * 1000 / rate) + 1000)
+if tokens >= 0 then
+    return 0
+end
+return math.ceil(-tokens * 1000 / rate)
+"""
+
+
+def local_bucket_factory(key, rate, sleep=time.sleep):
+    return TokenBucket(rate, sleep=sleep)
+
+
+class RedisTokenBucket(TokenBucket):
+    """Token bucket в Redis, общий для всех процессов и воркеров Celery; без Redis считает токены в процессе."""
+
+    def __init__(self, script, key, rate, capacity=None, clock=time.time, sleep=time.sleep):
+        super().__init__(rate, capacity, clock=clock, sleep=sleep)
+        self.script = script
+        self.key = key
+
+    def reserve(self):
+        try:
+            wait_ms = self.script(keys=[self.key], args=[int(self.clock() * 1000), self.rate, self.capacity])
+        except redis.RedisError as e:
+            logger.warning("Лимит Telegram считается в процессе, Redis недоступен: %s", e)
+            return super().reserve()
+        return wait_ms / 1000
+
+
+@lru_cache(maxsize=None)
+def get_token_bucket_script():
+    client = redis.Redis.from_url(
+        settings.TELEGRAM_RATE_LIMIT_REDIS_URL, socket_timeout=settings.TELEGRAM_RATE_LIMIT_REDIS_TIMEOUT
+    )
+    return client.register_script(TOKEN_BUCKET_SCRIPT)
+
+
+def redis_bucket_factory(key, rate, sleep=time.sleep):
+    return RedisTokenBucket(get_token_bucket_script(), f"telegram:bucket:{key}", rate, sleep=sleep)
+
+
+# Итог отправки одного напоминания; latency — секунды с учётом ожидания лимитов и повторов
+DeliveryResult = namedtuple("DeliveryResult", ["habit_id", "error", "attempts", "latency"])
+
+
+class TelegramDelivery:
+    """Отправка сообщений через один Bot с пулом соединений, лимитами Telegram и повторами.
+
+    Ведра лимитов создаёт bucket_factory(key, rate, sleep): по умолчанию они свои у процесса,
+    redis_bucket_factory делает общий и поканальные лимиты едиными для всех воркеров.
+    """
+
+    def __init__(
+        self,
+        bot,
+        rate_limit=30,
+        chat_rate_limit=1,
+        max_concurrency=8,
+        max_retries=3,
+        backoff=0.5,
+        sleep=time.sleep,
+        bucket_factory=None,
+    ):
+        self.bot = bot
+        self.chat_rate_limit = chat_rate_limit
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sleep = sleep
+        self.bucket_factory = bucket_factory or local_bucket_factory
+        self.bucket = self.bucket_factory("global", rate_limit, sleep=sleep)
+
+    def send(self, chat_id, text, chat_bucket=None):
+        """Отправляет одно сообщение. Возвращает None при успехе или последнюю ошибку."""
+        return self.deliver(chat_id, text, chat_bucket)[0]
+
+    def deliver(self, chat_id, text, chat_bucket=None):
+        """То же, что send, но возвращает пару (ошибка или None, число попыток)."""
+        for attempt in range(self.max_retries + 1):
+            if chat_bucket is not None:
+                chat_bucket.acquire()
+            self.bucket.acquire()
+            try:
+                self.bot.send_message(chat_id=chat_id, text=text)
+                return None, attempt + 1
+            except RetryAfter as e:
+                error, delay = e, e.retry_after
+            except BadRequest as e:
+                return e, attempt + 1
+            except NetworkError as e:
+                error, delay = e, self.backoff * 2**attempt
+            except telegram.error.TelegramError as e:
+                return e, attempt + 1
+            if attempt < self.max_retries:
+                logger.warning("Повтор отправки в чат %s через %.1f с: %s", chat_id, delay, error)
+                self.sleep(delay)
+        return error, self.max_retries + 1
+
+    def send_many(self, reminders):
+        """Параллельно отправляет [habit_id, chat_id, text]. Возвращает список DeliveryResult."""
+        chat_buckets = {}
+        for habit_id, chat_id, text in reminders:
+            if chat_id not in chat_buckets:
+                chat_buckets[chat_id] = self.bucket_factory(f"chat:{chat_id}", self.chat_rate_limit, sleep=self.sleep)
+
+        def deliver(reminder):
+            habit_id, chat_id, text = reminder
+            started = time.perf_counter()
+            error, attempts = self.deliver(chat_id, text, chat_buckets[chat_id])
+            if error is not None:
+                logger.error("Ошибка отправки напоминания по привычке %s: %s", habit_id, error)
+            return DeliveryResult(habit_id, error, attempts, time.perf_counter() - started)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(deliver, reminders))
+
+
+def create_bot(token=None, base_url=None, pool_size=None):
+    request = Request(con_pool_size=pool_size or settings.TELEGRAM_MAX_CONCURRENCY + 2)
+    return telegram.Bot(
+        token=token or settings.TELEGRAM_TOKEN,
+        base_url=base_url or settings.TELEGRAM_API_URL,
+        request=request,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_delivery():
+    """Один экземпляр на процесс воркера: соединения с Telegram переиспользуются между задачами."""
+    return TelegramDelivery(
+        create_bot(),
+        rate_limit=settings.TELEGRAM_RATE_LIMIT,
+        chat_rate_limit=settings.TELEGRAM_CHAT_RATE_LIMIT,
+        max_concurrency=settings.TELEGRAM_MAX_CONCURRENCY,
+        max_retries=settings.TELEGRAM_MAX_RETRIES,
+        bucket_factory=redis_bucket_factory if settings.TELEGRAM_RATE_LIMIT_REDIS_URL else None,
+    )
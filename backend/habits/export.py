@@ -0,0 +1,76 @@
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from .models import Habit, HabitCompletion
+from .serializers import habit_list_columns, iter_habit_rows
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Поля привычки в выгрузке: как в API, плюс даты выполнений
+EXPORT_FIELDS = (
+    "id",
+    "linked_habit",
+    "current_streak",
+    "place",
+    "time",
+    "action",
+    "is_pleasant",
+    "periodicity",
+    "reward",
+    "execution_time",
+    "is_public",
+    "created_at",
+    "next_due_date",
+    "longest_streak",
+    "last_completed_on",
+    "user",
+    "completions",
+)
+
+
+def iter_export_records(user_id, today=None):
+    """Потоково отдаёт привычки пользователя с датами выполнений.
+
+    Привычки и выполнения читаются двумя курсорами, отсортированными по id привычки, и сливаются,
+    поэтому в памяти держится только одна привычка с её историей.
+    """
+    habits = (
+        Habit.objects.filter(user_id=user_id)
+        .order_by("id")
+        .values(*habit_list_columns())
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    completions = (
+        HabitCompletion.objects.filter(habit__user_id=user_id)
+        .order_by("habit_id", "completed_on")
+        .values_list("habit_id", "completed_on")
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    pending = next(completions, None)
+    for habit in iter_habit_rows(habits, today):
+        dates = []
+        # Выполнения привычек, созданных уже после начала выгрузки, пропускаются
+        while pending is not None and pending[0] <= habit["id"]:
+            if pending[0] == habit["id"]:
+                dates.append(pending[1].isoformat())
+            pending = next(completions, None)
+        habit["completions"] = dates
+        yield habit
+
+
+def read_chunk(parts, size=EXPORT_CHUNK_SIZE):
+    """Следующие size частей ответа одним блоком байт; пустой блок — конец выгрузки."""
+    return b"".join(part.encode() if isinstance(part, str) else part for part in islice(parts, size))
+
+
+async def aiter_chunks(parts, size=EXPORT_CHUNK_SIZE):
+    """Асинхронный поток выгрузки для ASGI.
+
+    Синхронный итератор StreamingHttpResponse под ASGI собирает в список целиком; здесь каждая порция
+    читается из тех же курсоров отдельным sync_to_async, и в памяти держится только она.
+    """
+    parts = iter(parts)
+    read = sync_to_async(read_chunk)
+    while chunk := await read(parts, size):
+        yield chunk
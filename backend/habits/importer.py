@@ -0,0 +1,161 @@
+import csv
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.serializers import as_serializer_error
+from users.models import localdate_in
+
+from .caching import bump_public_feed_version
+from .models import Habit, HabitCompletion
+from .serializers import HabitImportSerializer
+
+User = get_user_model()
+
+IMPORT_BATCH_SIZE = 1000
+MAX_IMPORT_ERRORS = 100
+
+
+class HabitImportError(Exception):
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} ошибок импорта")
+        self.errors = errors
+
+
+def iter_import_records(lines, format):
+    """Пары (номер строки в файле, запись) из NDJSON или CSV в формате выгрузки; файл целиком в память не читается."""
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            record = {key: value for key, value in record.items() if value not in ("", None)}
+            if "completions" in record:
+                record["completions"] = record["completions"].split(";")
+            # line_num учитывает заголовок и пропущенные пустые строки
+            yield reader.line_num, record
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+class HabitImporter:
+    """Создаёт привычки пользователя из потока записей пачками bulk_create.
+
+    Ссылки linked_habit указывают на id привычек внутри файла: обратные проставляются сразу,
+    ссылки вперёд — одним bulk_update после чтения файла. При любой ошибке импорт откатывается
+    целиком, а run() выбрасывает HabitImportError с ошибками по номерам строк.
+    run() принимает пары (номер строки, запись), как их отдаёт iter_import_records.
+    """
+
+    def __init__(self, user_id, batch_size=IMPORT_BATCH_SIZE):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.references = {}  # id в файле -> (id в БД, is_pleasant)
+        self.links = []  # ссылки вперёд: (номер строки, id в БД, id в файле)
+        self.errors = []
+        self.created = 0
+        self.has_public = False
+
+    def add_error(self, number, errors):
+        self.errors.append({"line": number, "errors": errors})
+
+    def run(self, records):
+        # Один экземпляр на весь файл: поля сериализатора строятся один раз, как у дочернего в many=True
+        # Даты выполнений проверяются по календарю владельца, а не сервера; от него же отсчитываются напоминания
+        owner_timezone = User.objects.filter(pk=self.user_id).values_list("timezone", flat=True).first()
+        self.today = localdate_in(owner_timezone)
+        serializer = HabitImportSerializer(context={"today": self.today})
+        batch = []
+        with transaction.atomic():
+            for number, record in records:
+                if not isinstance(record, dict):
+                    self.add_error(number, {"non_field_errors": ["Ожидается объект привычки."]})
+                else:
+                    try:
+                        batch.append((number, serializer.run_validation(record)))
+                    except serializers.ValidationError as e:
+                        self.add_error(number, as_serializer_error(e))
+                if len(self.errors) >= MAX_IMPORT_ERRORS:
+                    break
+                if self.errors:
+                    # После первой ошибки ничего не пишем, только собираем остальные ошибки
+                    batch.clear()
+                elif len(batch) >= self.batch_size:
+                    self.save_batch(batch)
+                    batch.clear()
+            if batch and not self.errors:
+                self.save_batch(batch)
+            if not self.errors:
+                self.resolve_links()
+            if self.errors:
+                transaction.set_rollback(True)
+
+        if self.errors:
+            raise HabitImportError(self.errors)
+        if self.has_public:
+            bump_public_feed_version()
+        return self.created
+
+    def save_batch(self, batch):
+        habits = []
+        for number, data in batch:
+            data = dict(data)
+            file_id = data.pop("id", None)
+            reference = data.pop("linked_habit", None)
+            dates = sorted(set(data.pop("completions", [])))
+            if file_id is not None and file_id in self.references:
+                self.add_error(number, {"id": [f"Повторяющийся id {file_id}."]})
+                continue
+
+            habit = Habit(user_id=self.user_id, next_due_date=self.today, **data)
+            if reference in self.references and self.references[reference][0] is not None:
+                target_id, is_pleasant = self.references[reference]
+                if not is_pleasant:
+                    self.add_error(number, {"non_field_errors": ["Связанная привычка должна быть приятной."]})
+                    continue
+                habit.linked_habit_id = target_id
+                # Ссылка на привычку из этого же файла: владелец заведомо тот же, clean() его не запрашивает
+                habit._was_linked_habit_id = target_id
+            try:
+                habit.clean()
+            except ValidationError as e:
+                self.add_error(number, {"non_field_errors": e.messages})
+                continue
+            for date in dates:
+                habit.register_completion(date)
+            habits.append((number, file_id, reference, habit, dates))
+            if file_id is not None:
+                # id в БД появится после bulk_create; запись нужна уже сейчас, чтобы ловить повторы в пачке
+                self.references[file_id] = (None, habit.is_pleasant)
+
+        Habit.objects.bulk_create([habit for number, file_id, reference, habit, dates in habits])
+        completions = []
+        for number, file_id, reference, habit, dates in habits:
+            if file_id is not None:
+                self.references[file_id] = (habit.id, habit.is_pleasant)
+            if reference is not None and habit.linked_habit_id is None:
+                self.links.append((number, habit.id, reference))
+            completions.extend(HabitCompletion(habit_id=habit.id, completed_on=date) for date in dates)
+            self.has_public = self.has_public or habit.is_public
+        HabitCompletion.objects.bulk_create(completions)
+        self.created += len(habits)
+
+    def resolve_links(self):
+        updates = []
+        for number, habit_id, reference in self.links:
+            target_id, is_pleasant = self.references.get(reference, (None, None))
+            if target_id is None:
+                self.add_error(number, {"linked_habit": [f"Привычка {reference} не найдена в файле."]})
+            elif not is_pleasant:
+                self.add_error(number, {"non_field_errors": ["Связанная привычка должна быть приятной."]})
+            else:
+                updates.append(Habit(id=habit_id, linked_habit_id=target_id))
+        if not self.errors:
+            Habit.objects.bulk_update(updates, ["linked_habit"], batch_size=self.batch_size)
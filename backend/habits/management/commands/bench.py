@@ -0,0 +1,311 @@
+import datetime
+import json
+import random
+import statistics
+import time
+from unittest import mock
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.celery import app as celery_app
+from habits.caching import bump_public_feed_version
+from habits.delivery import TelegramDelivery
+from habits.models import Habit, HabitStat, ReminderDelivery
+from habits.renderers import ORJSONRenderer
+from habits.serializers import HabitSerializer, habit_list_columns, serialize_habit_rows
+from habits.tasks import iter_due_reminders, schedule_daily_reminders, send_telegram_reminder
+from habits.views import HabitStatsView, HabitViewSet
+
+User = get_user_model()
+
+list_view = HabitViewSet.as_view({"get": "list", "post": "create"})
+detail_view = HabitViewSet.as_view({"patch": "partial_update"})
+stats_view = HabitStatsView.as_view()
+
+
+class FakeBot:
+    """Bot без сети: считает сообщения и при необходимости имитирует задержку Telegram."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = 0
+
+    def send_message(self, chat_id, text):
+        if self.latency:
+            time.sleep(self.latency)
+        self.sent += 1
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(percent / 100 * (len(values) - 1)))]
+
+
+def summarize(latencies, queries, operations=None):
+    """Сводка по замеру: операций в секунду, p50/p99/среднее в миллисекундах и число SQL-запросов на итерацию."""
+    total = sum(latencies)
+    return {
+        "iterations": len(latencies),
+        "operations": operations or len(latencies),
+        "throughput_per_s": round((operations or len(latencies)) / total, 1) if total else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "queries_median": statistics.median(queries),
+        "queries_max": max(queries),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Набор замеров производительности на синтетических данных: API привычек, публичная лента, статистика, "
+        "сериализация списка, выборка и рассылка напоминаний. Выводит JSON для сравнения между релизами; "
+        "изменения в БД откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--habits-per-user", type=int, default=20)
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--reminder-runs", type=int, default=3)
+        parser.add_argument("--stats-weeks", type=int, default=52, help="Длина истории недельной статистики")
+        parser.add_argument("--page-size", type=int, default=1000, help="Привычек на странице при сериализации")
+        parser.add_argument("--telegram-latency-ms", type=float, default=0.0)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Файл для JSON, по умолчанию stdout")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.factory = APIRequestFactory()
+        self.today = timezone.localdate()
+        self.bot = FakeBot(options["telegram_latency_ms"] / 1000)
+        delivery = TelegramDelivery(self.bot, rate_limit=1e9, chat_rate_limit=1e9, sleep=lambda seconds: None)
+
+        # Задачи Celery (chord рассылки и отправка пачек) выполняются в этом же процессе
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        try:
+            results, seed_seconds = self.bench(options, delivery)
+        finally:
+            celery_app.conf.task_always_eager = always_eager
+
+        report = {
+            "meta": {
+                "users": options["users"],
+                "habits": options["users"] * options["habits_per_user"],
+                "iterations": options["iterations"],
+                "seed_seconds": round(seed_seconds, 3),
+                "database": connection.vendor,
+                "django": django.get_version(),
+                "telegram_latency_ms": options["telegram_latency_ms"],
+                "stats_weeks": options["stats_weeks"],
+                "page_size": options["page_size"],
+            },
+            "results": results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def bench(self, options, delivery):
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=["*"]), mock.patch(
+            "habits.tasks.get_delivery", return_value=delivery
+        ):
+            started = time.perf_counter()
+            self.seed(options["users"], options["habits_per_user"])
+            seed_seconds = time.perf_counter() - started
+
+            iterations = options["iterations"]
+            results = {
+                "habits.list": self.bench_list(iterations),
+                "habits.create": self.bench_create(iterations),
+                "habits.update": self.bench_update(iterations),
+                "public_feed.cached": self.bench_public_feed(iterations, cold=False),
+                "public_feed.cold": self.bench_public_feed(iterations, cold=True),
+                "stats.week": self.bench_stats(iterations, options["stats_weeks"]),
+                **self.bench_serializer(iterations, options["page_size"]),
+                "reminders.due_scan": self.bench_due_scan(options["reminder_runs"]),
+                "send_telegram_reminder": self.bench_send_telegram_reminder(iterations),
+                "schedule_daily_reminders": self.bench_schedule(options["reminder_runs"]),
+            }
+            transaction.set_rollback(True)
+        return results, seed_seconds
+
+    def seed(self, users, habits_per_user):
+        password = make_password(None)
+        self.users = User.objects.bulk_create(
+            [
+                User(email=f"bench-{i}@example.com", password=password, telegram_chat_id=str(1_000_000 + i))
+                for i in range(users)
+            ],
+            batch_size=5000,
+        )
+        self.tokens = {user.id: f"Bearer {AccessToken.for_user(user)}" for user in self.users}
+        batch = []
+        for user in self.users:
+            for i in range(habits_per_user):
+                periodicity = self.random.randint(1, 7)
+                batch.append(
+                    Habit(
+                        user_id=user.id,
+                        place="Home",
+                        time=datetime.time(self.random.randrange(24), self.random.randrange(60)),
+                        action=f"Action {i}",
+                        is_pleasant=i % 5 == 0,
+                        periodicity=periodicity,
+                        execution_time=60,
+                        is_public=i % 10 == 0,
+                        next_due_date=self.today + datetime.timedelta(days=self.random.randrange(periodicity)),
+                    )
+                )
+                if len(batch) >= 5000:
+                    Habit.objects.bulk_create(batch)
+                    batch = []
+        Habit.objects.bulk_create(batch)
+        self.habit_ids = list(Habit.objects.filter(is_pleasant=False).values_list("id", "user_id"))
+
+    def request(self, view, method, user_id, path, data=None, **kwargs):
+        request = getattr(self.factory, method)(path, data, format="json", HTTP_AUTHORIZATION=self.tokens[user_id])
+        response = view(request, **kwargs)
+        response.render()
+        return response
+
+    def run(self, iterations, operation, prepare=None):
+        latencies, queries = [], []
+        for i in range(iterations):
+            if prepare is not None:
+                prepare(i)
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                operation(i)
+                latencies.append(time.perf_counter() - started)
+            queries.append(len(context.captured_queries))
+        return latencies, queries
+
+    def bench_list(self, iterations):
+        def operation(i):
+            user = self.random.choice(self.users)
+            self.request(list_view, "get", user.id, "/api/habits/habits/", {"page": self.random.randint(1, 2)})
+
+        return summarize(*self.run(iterations, operation))
+
+    def bench_create(self, iterations):
+        def operation(i):
+            user = self.random.choice(self.users)
+            data = {"place": "Gym", "time": "18:00", "action": f"Bench {i}", "execution_time": 60}
+            self.request(list_view, "post", user.id, "/api/habits/habits/", data)
+
+        return summarize(*self.run(iterations, operation))
+
+    def bench_update(self, iterations):
+        def operation(i):
+            habit_id, user_id = self.random.choice(self.habit_ids)
+            path = f"/api/habits/habits/{habit_id}/"
+            self.request(detail_view, "patch", user_id, path, {"place": f"Office {i}"}, pk=habit_id)
+
+        return summarize(*self.run(iterations, operation))
+
+    def bench_public_feed(self, iterations, cold):
+        def operation(i):
+            if cold:
+                bump_public_feed_version()
+            user = self.random.choice(self.users)
+            self.request(list_view, "get", user.id, "/api/habits/habits/", {"public": "true"})
+
+        # Первый запрос прогревает кэш и аутентификацию
+        operation(-1)
+        return summarize(*self.run(iterations, operation))
+
+    def bench_stats(self, iterations, weeks):
+        user = self.users[0]
+        week_start = HabitStat.period_start_for(HabitStat.WEEK, self.today)
+        HabitStat.objects.bulk_create(
+            [
+                HabitStat(
+                    habit_id=habit_id,
+                    user_id=user.id,
+                    period=HabitStat.WEEK,
+                    period_start=week_start - datetime.timedelta(weeks=week),
+                    days_tracked=7,
+                    completions=5,
+                    rolled_up_to=week_start - datetime.timedelta(weeks=week, days=-6),
+                )
+                for habit_id in Habit.objects.filter(user=user).values_list("id", flat=True)
+                for week in range(weeks)
+            ],
+            batch_size=5000,
+        )
+
+        def operation(i):
+            self.request(stats_view, "get", user.id, "/api/habits/stats/", {"period": "week"})
+
+        result = summarize(*self.run(iterations, operation))
+        result["history_rows"] = HabitStat.objects.filter(user=user).count()
+        return result
+
+    def bench_serializer(self, iterations, page_size):
+        """HabitSerializer + JSONRenderer против быстрого пути списка; вывод обоих должен совпадать байт в байт."""
+        queryset = Habit.objects.select_related("user").order_by("id")[:page_size]
+        rows = Habit.objects.order_by("id").values(*habit_list_columns())[:page_size]
+
+        def drf():
+            return JSONRenderer().render(HabitSerializer(queryset, many=True).data)
+
+        def fast():
+            return ORJSONRenderer().render(serialize_habit_rows(rows))
+
+        if drf() != fast():
+            raise CommandError("Вывод быстрого пути отличается от HabitSerializer")
+        items = len(rows)
+        return {
+            "serializer.drf": summarize(*self.run(iterations, lambda i: drf()), operations=iterations * items),
+            "serializer.fast": summarize(*self.run(iterations, lambda i: fast()), operations=iterations * items),
+        }
+
+    def bench_due_scan(self, runs):
+        due = []
+
+        def operation(i):
+            due.append(sum(1 for _ in iter_due_reminders(self.today)))
+
+        result = summarize(*self.run(runs, operation))
+        result["reminders_per_run"] = statistics.median(due)
+        return result
+
+    def bench_send_telegram_reminder(self, iterations):
+        def operation(i):
+            habit_id, user_id = self.random.choice(self.habit_ids)
+            send_telegram_reminder(user_id, habit_id)
+
+        return summarize(*self.run(iterations, operation))
+
+    def bench_schedule(self, runs):
+        due_ids = list(Habit.objects.filter(next_due_date=self.today).values_list("id", flat=True))
+        sent = []
+
+        def prepare(i):
+            # Каждый прогон начинает с одного и того же набора привычек на сегодня
+            Habit.objects.filter(id__in=due_ids).update(next_due_date=self.today)
+            ReminderDelivery.objects.all().delete()
+
+        def operation(i):
+            before = self.bot.sent
+            schedule_daily_reminders()
+            sent.append(self.bot.sent - before)
+
+        latencies, queries = self.run(runs, operation, prepare)
+        result = summarize(latencies, queries, operations=sum(sent))
+        result["reminders_per_run"] = statistics.median(sent)
+        return result
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+
+from habits.models import Habit
+
+
+class Command(BaseCommand):
+    help = "Нагрузочная проверка переиспользования соединений с БД в циклах запросов и задач Celery."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        opened = []
+
+        def count_connection(sender, **kwargs):
+            opened.append(1)
+
+        connection_created.connect(count_connection)
+        try:
+            self.run("web request", options["iterations"], opened, self.web_request)
+            self.run("celery task", options["iterations"], opened, self.celery_task)
+        finally:
+            connection_created.disconnect(count_connection)
+        self.stdout.write(f"CONN_MAX_AGE={connection.settings_dict['CONN_MAX_AGE']}")
+
+    def run(self, name, iterations, opened, cycle):
+        connection.close()
+        opened.clear()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            cycle()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{name}: {iterations} cycles, {len(opened)} connections opened, "
+            f"{elapsed / iterations * 1000:.2f} ms per cycle"
+        )
+
+    @staticmethod
+    def web_request():
+        # Тот же жизненный цикл, что у запроса gunicorn: Django закрывает устаревшие соединения по сигналам
+        request_started.send(sender=None)
+        Habit.objects.exists()
+        request_finished.send(sender=None)
+
+    @staticmethod
+    def celery_task():
+        # Фиксап Celery для Django вызывает ту же проверку до и после каждой задачи
+        close_old_connections()
+        Habit.objects.exists()
+        close_old_connections()
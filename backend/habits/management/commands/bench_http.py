@@ -0,0 +1,48 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест запущенного сервера: req/s и задержки p50/p99. "
+        "Запускается отдельно против SERVER_MODE=wsgi и SERVER_MODE=asgi."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Например, http://localhost:8000/api/habits/habits/")
+        parser.add_argument("--token", help="JWT access-токен")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=50)
+
+    def handle(self, *args, **options):
+        headers = {"Authorization": f"Bearer {options['token']}"} if options["token"] else {}
+
+        def fetch(_):
+            request = urllib.request.Request(options["url"], headers=headers)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            results = list(executor.map(fetch, range(options["requests"])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, status in results)
+        errors = sum(1 for latency, status in results if status >= 400)
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{options['requests']} requests, concurrency {options['concurrency']}: "
+            f"{options['requests'] / elapsed:.1f} req/s, p50 {percentiles[49] * 1000:.1f} ms, "
+            f"p99 {percentiles[98] * 1000:.1f} ms, errors {errors}"
+        )
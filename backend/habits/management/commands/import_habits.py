@@ -0,0 +1,40 @@
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from habits.importer import IMPORT_BATCH_SIZE, HabitImporter, HabitImportError, iter_import_records
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Импортирует привычки пользователя из CSV или NDJSON (формат /api/habits/export/)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл для импорта, - для stdin")
+        parser.add_argument("--user", required=True, help="Email пользователя")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="По умолчанию — по расширению файла")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        user_id = User.objects.filter(email=options["user"]).values_list("id", flat=True).first()
+        if user_id is None:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+        format = options["format"] or ("csv" if options["path"].endswith(".csv") else "ndjson")
+
+        importer = HabitImporter(user_id, batch_size=options["batch_size"])
+        started = time.perf_counter()
+        try:
+            if options["path"] == "-":
+                created = importer.run(iter_import_records(sys.stdin, format))
+            else:
+                with open(options["path"], encoding="utf-8", newline="") as lines:
+                    created = importer.run(iter_import_records(lines, format))
+        except HabitImportError as e:
+            for error in e.errors:
+                self.stderr.write(f"строка {error['line']}: {error['errors']}")
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"imported {created} habits in {elapsed:.2f} s ({created / elapsed:.0f} rows/s)")
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 16:36
+
+import datetime
+from collections import defaultdict
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_next_due_date(apps, schema_editor):
+    # Дата зависит только от периодичности и остатка (сегодня - день создания) по её модулю:
+    # один UPDATE на такую пару, не больше 28 запросов вместо save() на каждую привычку
+    Habit = apps.get_model("habits", "Habit")
+    today = timezone.localdate()
+    Habit.objects.filter(periodicity__lte=1).update(next_due_date=today)
+    created_days = (
+        Habit.objects.filter(periodicity__gt=1)
+        .annotate(created_day=TruncDate("created_at"))
+        .order_by()
+        .values_list("periodicity", "created_day")
+        .distinct()
+    )
+    groups = defaultdict(list)
+    for periodicity, created_day in created_days:
+        groups[periodicity, -(today - created_day).days % periodicity].append(created_day)
+    for (periodicity, offset), days in groups.items():
+        Habit.objects.filter(periodicity=periodicity, created_at__date__in=days).update(
+            next_due_date=today + datetime.timedelta(days=offset)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='next_due_date',
+            field=models.DateField(default=django.utils.timezone.localdate, help_text='Дата следующего напоминания'),
+        ),
+        migrations.RunPython(backfill_next_due_date, migrations.RunPython.noop),
+    ]
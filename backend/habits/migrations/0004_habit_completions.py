@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 16:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0003_habit_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='current_streak',
+            field=models.PositiveIntegerField(default=0, help_text='Текущая серия выполнений подряд'),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='last_completed_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='longest_streak',
+            field=models.PositiveIntegerField(default=0, help_text='Самая длинная серия выполнений'),
+        ),
+        migrations.CreateModel(
+            name='HabitCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_on', models.DateField(default=django.utils.timezone.localdate)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='habits.habit')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('habit', 'completed_on'), name='habit_completion_unique_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 16:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0004_habit_completions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Неделя'), ('month', 'Месяц')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('days_tracked', models.PositiveSmallIntegerField(default=0)),
+                ('completions', models.PositiveSmallIntegerField(default=0)),
+                ('rolled_up_to', models.DateField(help_text='Последний день, учтённый в статистике')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='habitcompletion',
+            index=models.Index(fields=['completed_on'], name='habit_completion_day_idx'),
+        ),
+        migrations.AddField(
+            model_name='habitstat',
+            name='habit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='habits.habit'),
+        ),
+        migrations.AddField(
+            model_name='habitstat',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='habit_stats', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='habitstat',
+            index=models.Index(fields=['user', 'period', 'period_start'], name='habit_stat_user_period_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='habitstat',
+            constraint=models.UniqueConstraint(fields=('habit', 'period', 'period_start'), name='habit_stat_unique_period'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 17:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0005_habit_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='День напоминания в часовом поясе пользователя')),
+                ('run_id', models.UUIDField(help_text='Рассылка, которая последней поставила напоминание в очередь')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=7)),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='Попыток отправки в Telegram')),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='habits.habit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run_id'], name='reminder_delivery_run_idx'), models.Index(condition=models.Q(('status', 'sent'), _negated=True), fields=['date'], name='reminder_delivery_retry_idx')],
+                'constraints': [models.UniqueConstraint(fields=('habit', 'date'), name='reminder_delivery_unique_day')],
+            },
+        ),
+    ]
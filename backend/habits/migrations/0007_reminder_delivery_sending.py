@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0006_reminder_delivery'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reminderdelivery',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=7),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 18:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0007_reminder_delivery_sending'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='habit',
+            name='habit_reminder_due_idx',
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_pleasant', False), ('is_public', False)), fields=['time', 'next_due_date'], name='habit_reminder_due_idx'),
+        ),
+    ]
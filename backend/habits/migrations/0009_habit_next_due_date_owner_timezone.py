@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0008_habit_reminder_due_idx_time_first'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='habit',
+            name='next_due_date',
+            field=models.DateField(blank=True, help_text='Дата следующего напоминания'),
+        ),
+    ]
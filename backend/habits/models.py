@@ -1,10 +1,38 @@
+import datetime
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from users.models import localdate_in
 
 User = get_user_model()
 
 
+class HabitQuerySet(models.QuerySet):
+    def reminder_eligible(self):
+        return self.filter(is_public=False, is_pleasant=False)
+
+    def with_telegram_chat(self):
+        return self.filter(user__telegram_chat_id__isnull=False)
+
+    def due_on(self, date):
+        return self.filter(next_due_date__lte=date)
+
+    def advance_due_dates(self, date):
+        """Сдвигает next_due_date на следующий период одним UPDATE."""
+        return self.update(
+            next_due_date=models.Case(
+                *[
+                    models.When(periodicity=days, then=models.Value(date + datetime.timedelta(days=days)))
+                    for days in range(1, 8)
+                ],
+                default=models.Value(date + datetime.timedelta(days=1)),
+                output_field=models.DateField(),
+            )
+        )
+
+
 class Habit(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="habits")
     place = models.CharField(max_length=255)
@@ -17,6 +45,34 @@ class Habit(models.Model):
     execution_time = models.PositiveSmallIntegerField(help_text="Время в секундах")
     is_public = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Без явного значения save() ставит сегодняшнюю дату в часовом поясе владельца
+    next_due_date = models.DateField(blank=True, help_text="Дата следующего напоминания")
+    current_streak = models.PositiveIntegerField(default=0, help_text="Текущая серия выполнений подряд")
+    longest_streak = models.PositiveIntegerField(default=0, help_text="Самая длинная серия выполнений")
+    last_completed_on = models.DateField(null=True, blank=True)
+
+    objects = HabitQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "id"], name="habit_user_id_idx"),
+            models.Index(fields=["id"], condition=models.Q(is_public=True), name="habit_public_feed_idx"),
+            models.Index(
+                # Время впереди: окно в минуты отсекает почти всё, а next_due_date <= дата — почти ничего
+                fields=["time", "next_due_date"],
+                condition=models.Q(is_public=False, is_pleasant=False),
+                name="habit_reminder_due_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходную публичность, чтобы сбрасывать кэш ленты и при снятии флага
+        instance._was_public = instance.__dict__.get("is_public", False)
+        # и связь, чтобы проверять владельца связанной привычки только при её изменении
+        instance._was_linked_habit_id = instance.__dict__.get("linked_habit_id")
+        return instance
 
     def clean(self):
         if self.execution_time > 120:
@@ -26,17 +82,168 @@ class Habit(models.Model):
             raise ValidationError("Периодичность должна быть от 1 до 7 дней.")
 
         if self.is_pleasant:
-            if self.reward or self.linked_habit:
+            if self.reward or self.linked_habit_id:
                 raise ValidationError("Приятная привычка не может иметь награду или связанную привычку.")
         else:
-            if self.reward and self.linked_habit:
+            if self.reward and self.linked_habit_id:
                 raise ValidationError("Укажите либо награду, либо связанную привычку, но не оба поля.")
-            if self.linked_habit and self.linked_habit.user != self.user:
+            if self.changed_linked_habit_owner() not in (None, self.user_id):
                 raise ValidationError("Нельзя ссылаться на чужую привычку.")
 
+    def changed_linked_habit_owner(self):
+        """Владелец связанной привычки, если связь изменилась с загрузки, иначе None.
+
+        Берётся из закэшированной связи или одним запросом user_id, чтобы не подгружать привычку при каждом save.
+        """
+        if self.linked_habit_id is None or self.linked_habit_id == getattr(self, "_was_linked_habit_id", None):
+            return None
+        if self._meta.get_field("linked_habit").is_cached(self):
+            return self.linked_habit.user_id
+        return Habit.objects.filter(pk=self.linked_habit_id).values_list("user_id", flat=True).first()
+
+    def owner_localdate(self):
+        """Сегодняшняя дата в часовом поясе владельца: из загруженного пользователя или одним запросом."""
+        if self._meta.get_field("user").is_cached(self):
+            return localdate_in(self.user.timezone)
+        return localdate_in(User.objects.filter(pk=self.user_id).values_list("timezone", flat=True).first())
+
+    @staticmethod
+    def is_streak_active(last_completed_on, periodicity, date):
+        """Серия не прервана, если с последнего выполнения прошло не больше одного периода."""
+        return last_completed_on is not None and (date - last_completed_on).days <= periodicity
+
+    def streak_is_active(self, date):
+        return self.is_streak_active(self.last_completed_on, self.periodicity, date)
+
+    def register_completion(self, date):
+        """Обновляет счётчики серии за O(1); даты не раньше last_completed_on проверяет вызывающий код."""
+        if self.streak_is_active(date):
+            self.current_streak += 1
+        else:
+            self.current_streak = 1
+        self.longest_streak = max(self.longest_streak, self.current_streak)
+        self.last_completed_on = date
+
     def save(self, *args, **kwargs):
-        self.full_clean()
+        if self.next_due_date is None:
+            # Сроки рассылка сверяет с датой пользователя: первое напоминание — сегодня по его календарю
+            self.next_due_date = self.owner_localdate()
+        # Существование user и linked_habit гарантирует внешний ключ в БД — не проверяем их отдельными запросами
+        self.full_clean(exclude=["user", "linked_habit"], validate_unique=False, validate_constraints=False)
         super().save(*args, **kwargs)
+        self._was_linked_habit_id = self.linked_habit_id
 
     def __str__(self):
         return f"{self.action} в {self.place} ({self.time})"
+
+
+class HabitCompletion(models.Model):
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="completions")
+    completed_on = models.DateField(default=timezone.localdate)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["habit", "completed_on"], name="habit_completion_unique_day"),
+        ]
+        indexes = [
+            models.Index(fields=["completed_on"], name="habit_completion_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.habit_id}: {self.completed_on}"
+
+
+class HabitStat(models.Model):
+    """Накопительная статистика привычки за неделю или месяц, дополняется ежедневно по одному дню."""
+
+    WEEK = "week"
+    MONTH = "month"
+    PERIOD_CHOICES = [(WEEK, "Неделя"), (MONTH, "Месяц")]
+
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="stats")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="habit_stats")
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    days_tracked = models.PositiveSmallIntegerField(default=0)
+    completions = models.PositiveSmallIntegerField(default=0)
+    rolled_up_to = models.DateField(help_text="Последний день, учтённый в статистике")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["habit", "period", "period_start"], name="habit_stat_unique_period"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "period", "period_start"], name="habit_stat_user_period_idx"),
+        ]
+
+    @staticmethod
+    def period_start_for(period, date):
+        if period == HabitStat.WEEK:
+            return date - datetime.timedelta(days=date.weekday())
+        return date.replace(day=1)
+
+    @property
+    def expected_completions(self):
+        return -(-self.days_tracked // self.habit.periodicity)
+
+    @property
+    def completion_rate(self):
+        expected = self.expected_completions
+        return round(min(self.completions / expected, 1), 4) if expected else None
+
+
+class ReminderDeliveryQuerySet(models.QuerySet):
+    def run_summary(self, run_id):
+        """Итоги одной рассылки: число напоминаний по статусам, средняя задержка и скорость отправки."""
+        summary = self.filter(run_id=run_id).aggregate(
+            total=models.Count("id"),
+            sent=models.Count("id", filter=models.Q(status=ReminderDelivery.SENT)),
+            failed=models.Count("id", filter=models.Q(status=ReminderDelivery.FAILED)),
+            avg_latency_ms=models.Avg("latency_ms"),
+            started=models.Min("queued_at"),
+            finished=models.Max("finished_at"),
+        )
+        elapsed = None
+        if summary["started"] and summary["finished"]:
+            elapsed = (summary["finished"] - summary["started"]).total_seconds()
+        summary["per_second"] = round(summary["sent"] / elapsed, 1) if elapsed else None
+        return summary
+
+
+class ReminderDelivery(models.Model):
+    """Журнал отправки напоминаний: одна запись на привычку и день, повторная рассылка её не дублирует."""
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "В очереди"), (SENDING, "Отправляется"), (SENT, "Отправлено"), (FAILED, "Ошибка")]
+
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="deliveries")
+    date = models.DateField(help_text="День напоминания в часовом поясе пользователя")
+    run_id = models.UUIDField(help_text="Рассылка, которая последней поставила напоминание в очередь")
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0, help_text="Попыток отправки в Telegram")
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    queued_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ReminderDeliveryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["habit", "date"], name="reminder_delivery_unique_day"),
+        ]
+        indexes = [
+            models.Index(fields=["run_id"], name="reminder_delivery_run_idx"),
+            models.Index(
+                fields=["date"],
+                condition=~models.Q(status="sent"),
+                name="reminder_delivery_retry_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.habit_id}: {self.date} ({self.status})"
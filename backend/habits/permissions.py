@@ -4,5 +4,5 @@ from rest_framework import permissions
 class IsOwnerOrReadOnlyPublic(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
-            return obj.is_public or obj.user == request.user
-        return obj.user == request.user
+            return obj.is_public or obj.user_id == request.user.id
+        return obj.user_id == request.user.id
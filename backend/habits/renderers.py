@@ -0,0 +1,70 @@
+import csv
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .export import EXPORT_FIELDS
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же выводом байт в байт.
+
+    Даты, время и прочие нестандартные типы кодирует JSONEncoder DRF, как и в JSONRenderer;
+    при запросе отступов или ASCII-вывода рендер уходит в JSONRenderer.
+    """
+
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        # JSONRenderer экранирует разделители строк, недопустимые в JavaScript
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Одна JSON-запись на строку; stream() отдаёт строки по мере чтения записей."""
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def stream(self, records):
+        for record in records:
+            yield orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b"".join(self.stream([data] if isinstance(data, dict) else data))
+
+
+class CSVRenderer(BaseRenderer):
+    """CSV с заголовком из EXPORT_FIELDS; списки пишутся в одну ячейку через ";"."""
+
+    media_type = "text/csv"
+    format = "csv"
+
+    class Echo:
+        def write(self, value):
+            return value
+
+    def stream(self, records):
+        writer = csv.writer(self.Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for record in records:
+            yield writer.writerow(
+                ";".join(value) if isinstance(value, list) else value
+                for value in (record.get(field) for field in EXPORT_FIELDS)
+            )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and "id" not in data:
+            # Ошибки (например, 401) пишутся своими колонками, без заголовка выгрузки
+            writer = csv.writer(self.Echo())
+            return "".join([writer.writerow(data), writer.writerow(data.values())]).encode()
+        return "".join(self.stream([data] if isinstance(data, dict) else data)).encode()
@@ -1,16 +1,64 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Habit
+from users.models import localdate_in
+from .models import Habit, HabitCompletion, HabitStat
+
+
+def linked_habit_queryset(user):
+    return Habit.objects.filter(user_id=user.id).only("id", "user_id", "is_pleasant")
+
+
+class LinkedHabitField(serializers.PrimaryKeyRelatedField):
+    """Связанная привычка ищется только среди привычек текущего пользователя и только с нужными полями.
+
+    Если в контексте передан словарь linked_habits {id: Habit}, привычка берётся из него без запроса к БД.
+    """
+
+    def get_queryset(self):
+        request = self.context.get("request")
+        if request is None:
+            return Habit.objects.only("id", "user_id", "is_pleasant")
+        return linked_habit_queryset(request.user)
+
+    def to_internal_value(self, data):
+        linked_habits = self.context.get("linked_habits")
+        if linked_habits is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return linked_habits[int(data)]
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
 
 
 class HabitSerializer(serializers.ModelSerializer):
-    linked_habit = serializers.PrimaryKeyRelatedField(queryset=Habit.objects.all(), allow_null=True, required=False)
+    linked_habit = LinkedHabitField(allow_null=True, required=False)
+    current_streak = serializers.SerializerMethodField()
 
     class Meta:
         model = Habit
         fields = "__all__"
-        read_only_fields = ("user",)
+        read_only_fields = ("user", "next_due_date", "longest_streak", "last_completed_on")
+
+    def get_current_streak(self, habit):
+        # Счётчик хранится с момента последнего выполнения; если период пропущен, серия уже прервана.
+        # Без выполнений дата не нужна, и часовой пояс владельца не запрашивается
+        if habit.last_completed_on is None:
+            return 0
+        return habit.current_streak if habit.streak_is_active(habit.owner_localdate()) else 0
 
     def validate(self, data):
+        # При частичном обновлении недостающие значения берём из самой привычки (без загрузки связей)
+        instance = self.instance
+
+        def current(field, default=None):
+            if field in data:
+                return data[field]
+            return getattr(instance, field, default) if instance is not None else default
+
         execution_time = data.get("execution_time")
         if execution_time and execution_time > 120:
             raise serializers.ValidationError("Время выполнения не может превышать 120 секунд.")
@@ -19,17 +67,176 @@ class HabitSerializer(serializers.ModelSerializer):
         if periodicity and not (1 <= periodicity <= 7):
             raise serializers.ValidationError("Периодичность — от 1 до 7 дней.")
 
-        is_pleasant = data.get("is_pleasant", False)
-        reward = data.get("reward")
+        is_pleasant = current("is_pleasant", False)
+        reward = current("reward")
         linked_habit = data.get("linked_habit")
+        has_linked_habit = linked_habit is not None if "linked_habit" in data else current("linked_habit_id")
 
         if is_pleasant:
-            if reward or linked_habit:
+            if reward or has_linked_habit:
                 raise serializers.ValidationError("Приятная привычка не может иметь награду или связанную привычку.")
         else:
-            if reward and linked_habit:
+            if reward and has_linked_habit:
                 raise serializers.ValidationError("Можно указать либо награду, либо связанную привычку, но не оба.")
             if linked_habit and not linked_habit.is_pleasant:
                 raise serializers.ValidationError("Связанная привычка должна быть приятной.")
 
         return data
+
+
+class HabitImportSerializer(HabitSerializer):
+    """Строка импорта: id и linked_habit — номера привычек внутри файла, completions — даты выполнений."""
+
+    id = serializers.IntegerField(required=False, allow_null=True)
+    linked_habit = serializers.IntegerField(required=False, allow_null=True)
+    completions = serializers.ListField(child=serializers.DateField(), required=False)
+
+    def validate_completions(self, value):
+        today = self.context.get("today") or timezone.localdate()
+        if any(date > today for date in value):
+            raise serializers.ValidationError("Нельзя отметить выполнение в будущем.")
+        return value
+
+    def validate(self, data):
+        # Приятность связанной привычки проверяется при разрешении ссылок внутри файла
+        reference = data.pop("linked_habit", None)
+        data = super().validate(data)
+        if reference is not None:
+            if data.get("is_pleasant"):
+                raise serializers.ValidationError("Приятная привычка не может иметь награду или связанную привычку.")
+            if data.get("reward"):
+                raise serializers.ValidationError("Можно указать либо награду, либо связанную привычку, но не оба.")
+            data["linked_habit"] = reference
+        return data
+
+
+# Быстрый путь для списков: строки values() превращаются в те же словари, что выдаёт HabitSerializer,
+# без создания моделей и пополевой сериализации DRF. Порядок ключей совпадает с HabitSerializer.
+HABIT_LIST_COLUMNS = (
+    "id",
+    "linked_habit_id",
+    "current_streak",
+    "place",
+    "time",
+    "action",
+    "is_pleasant",
+    "periodicity",
+    "reward",
+    "execution_time",
+    "is_public",
+    "created_at",
+    "next_due_date",
+    "longest_streak",
+    "last_completed_on",
+    "user_id",
+)
+
+# Часовой пояс владельца: «сегодня» для current_streak считается в нём
+OWNER_TIMEZONE_COLUMN = "user__timezone"
+
+_datetime_field = serializers.DateTimeField()
+
+
+# Поля автора, которые раскрываются в публичной ленте (email не публикуется)
+PUBLIC_USER_COLUMNS = ("id", "timezone")
+
+LINKED_HABIT_COLUMNS = tuple((f"linked_habit__{column}", column) for column in HABIT_LIST_COLUMNS)
+USER_COLUMNS = tuple((f"user__{column}", column) for column in PUBLIC_USER_COLUMNS)
+
+
+def habit_list_columns(expand=()):
+    """Колонки для values(): к HABIT_LIST_COLUMNS добавляются часовой пояс владельца и поля раскрываемых связей
+    из того же JOIN."""
+    columns = HABIT_LIST_COLUMNS + (OWNER_TIMEZONE_COLUMN,)
+    if "linked_habit" in expand:
+        columns += tuple(column for column, field in LINKED_HABIT_COLUMNS)
+    if "user" in expand:
+        columns += tuple(column for column, field in USER_COLUMNS if column != OWNER_TIMEZONE_COLUMN)
+    return columns
+
+
+def iter_habit_rows(rows, today=None, expand=(), user_id=None):
+    """Словари queryset.values(*habit_list_columns(expand)) в формате HabitSerializer, по одному.
+
+    Связанная привычка раскрывается, только если она публичная или принадлежит user_id,
+    иначе остаётся её id, как без expand. current_streak считается на сегодня в часовом поясе владельца
+    (связанная привычка всегда того же владельца), если today не задан явно.
+    """
+    to_datetime = _datetime_field.to_representation
+    is_streak_active = Habit.is_streak_active
+    todays = {}
+
+    def owner_today(row):
+        if today is not None:
+            return today
+        tz_name = row[OWNER_TIMEZONE_COLUMN]
+        if tz_name not in todays:
+            todays[tz_name] = localdate_in(tz_name)
+        return todays[tz_name]
+
+    def to_representation(row, today):
+        last_completed_on = row["last_completed_on"]
+        return {
+            "id": row["id"],
+            "linked_habit": row["linked_habit_id"],
+            "current_streak": (
+                row["current_streak"] if is_streak_active(last_completed_on, row["periodicity"], today) else 0
+            ),
+            "place": row["place"],
+            "time": row["time"].isoformat(),
+            "action": row["action"],
+            "is_pleasant": row["is_pleasant"],
+            "periodicity": row["periodicity"],
+            "reward": row["reward"],
+            "execution_time": row["execution_time"],
+            "is_public": row["is_public"],
+            "created_at": to_datetime(row["created_at"]),
+            "next_due_date": row["next_due_date"].isoformat(),
+            "longest_streak": row["longest_streak"],
+            "last_completed_on": last_completed_on.isoformat() if last_completed_on is not None else None,
+            "user": row["user_id"],
+        }
+
+    expand_linked_habit = "linked_habit" in expand
+    expand_user = "user" in expand
+    for row in rows:
+        row_today = owner_today(row)
+        habit = to_representation(row, row_today)
+        if expand_linked_habit and row["linked_habit_id"] is not None:
+            linked_habit = {field: row[column] for column, field in LINKED_HABIT_COLUMNS}
+            if linked_habit["is_public"] or linked_habit["user_id"] == user_id:
+                habit["linked_habit"] = to_representation(linked_habit, row_today)
+        if expand_user:
+            habit["user"] = {field: row[column] for column, field in USER_COLUMNS}
+        yield habit
+
+
+def serialize_habit_rows(rows, today=None, expand=(), user_id=None):
+    return list(iter_habit_rows(rows, today, expand, user_id))
+
+
+class HabitCompletionSerializer(serializers.ModelSerializer):
+    # Без умолчания модели (дата сервера): пропущенную дату подставляет представление по календарю владельца
+    completed_on = serializers.DateField(required=False)
+
+    class Meta:
+        model = HabitCompletion
+        fields = ("id", "habit", "completed_on", "created_at")
+        read_only_fields = ("habit",)
+
+    def validate_completed_on(self, value):
+        # «Сегодня» владельца привычки передаёт представление; без него — дата сервера
+        if value > (self.context.get("today") or timezone.localdate()):
+            raise serializers.ValidationError("Нельзя отметить выполнение в будущем.")
+        return value
+
+
+class HabitStatSerializer(serializers.ModelSerializer):
+    action = serializers.CharField(source="habit.action")
+    expected_completions = serializers.IntegerField()
+    completion_rate = serializers.FloatField(allow_null=True)
+
+    class Meta:
+        model = HabitStat
+        fields = ("habit", "action", "days_tracked", "completions", "expected_completions", "completion_rate")
+        read_only_fields = fields
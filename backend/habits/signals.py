@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import bump_public_feed_version
+from .models import Habit
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Habit)
+def invalidate_public_feed_on_save(sender, instance, **kwargs):
+    if instance.is_public or getattr(instance, "_was_public", False):
+        bump_public_feed_version()
+    instance._was_public = instance.is_public
+
+
+@receiver(post_delete, sender=Habit)
+def invalidate_public_feed_on_delete(sender, instance, **kwargs):
+    # Удаление может обнулить linked_habit у публичных привычек, поэтому сбрасываем всегда
+    bump_public_feed_version()
+
+
+@receiver(post_save, sender=User)
+def invalidate_public_feed_on_user_change(sender, instance, created, update_fields=None, **kwargs):
+    # Из полей пользователя публичная лента (?expand=user) показывает только часовой пояс автора
+    changed = not created and instance.timezone != getattr(instance, "_was_timezone", None)
+    if update_fields is not None and "timezone" not in update_fields:
+        changed = False
+    instance._was_timezone = instance.timezone
+    if changed and Habit.objects.filter(user_id=instance.pk, is_public=True).exists():
+        bump_public_feed_version()
@@ -0,0 +1,57 @@
+import datetime
+
+from django.db.models import Case, Exists, F, Max, OuterRef, Value, When
+
+from .models import Habit, HabitCompletion, HabitStat
+from .utils import chunked
+
+ROLLUP_CHUNK_SIZE = 2000
+
+
+def ensure_stat_rows(date):
+    """Создаёт недостающие строки недельной и месячной статистики для привычек, существовавших на дату."""
+    starts = {period: HabitStat.period_start_for(period, date) for period in (HabitStat.WEEK, HabitStat.MONTH)}
+    habits = Habit.objects.filter(created_at__date__lte=date).order_by("id").values_list("id", "user_id")
+    for chunk in chunked(habits.iterator(chunk_size=ROLLUP_CHUNK_SIZE), ROLLUP_CHUNK_SIZE):
+        HabitStat.objects.bulk_create(
+            [
+                HabitStat(
+                    habit_id=habit_id,
+                    user_id=user_id,
+                    period=period,
+                    period_start=start,
+                    rolled_up_to=start - datetime.timedelta(days=1),
+                )
+                for habit_id, user_id in chunk
+                for period, start in starts.items()
+            ],
+            ignore_conflicts=True,
+        )
+    return starts
+
+
+def rollup_day(date):
+    """Добавляет в статистику день date и все пропущенные до него дни, каждый ровно один раз.
+
+    Догоняет с дня после последнего учтённого, так что пропущенный запуск не теряет дни;
+    повторный запуск за ту же или более раннюю дату ничего не меняет.
+    """
+    last = HabitStat.objects.aggregate(last=Max("rolled_up_to"))["last"]
+    day = date if last is None else last + datetime.timedelta(days=1)
+    updated = 0
+    while day <= date:
+        updated += rollup_single_day(day)
+        day += datetime.timedelta(days=1)
+    return updated
+
+
+def rollup_single_day(date):
+    completed = HabitCompletion.objects.filter(habit_id=OuterRef("habit_id"), completed_on=date)
+    updated = 0
+    for period, start in ensure_stat_rows(date).items():
+        updated += HabitStat.objects.filter(period=period, period_start=start, rolled_up_to__lt=date).update(
+            days_tracked=F("days_tracked") + 1,
+            completions=F("completions") + Case(When(Exists(completed), then=Value(1)), default=Value(0)),
+            rolled_up_to=date,
+        )
+    return updated
@@ -1,39 +1,373 @@
-from celery import shared_task
+from celery import chord, current_app, shared_task
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Habit
+from django.core.cache import cache
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from config.celery import DELIVERY_QUEUE
+from config.task_metrics import BACKPRESSURE_WAIT, queue_length
+from .delivery import get_delivery
+from .models import Habit, ReminderDelivery
+from .stats import rollup_day
+from .utils import chunked, split_range
+import collections
 import datetime
-import telegram
-import os
-from dotenv import load_dotenv
+import itertools
+import logging
+import time
+import uuid
+import zoneinfo
 
 User = get_user_model()
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-TOKEN = os.getenv("TELEGRAM_TOKEN")
+REMINDER_CHUNK_SIZE = 2000
+
+TIMEZONES_CACHE_KEY = "reminders:timezones"
+TIMEZONES_CACHE_TIMEOUT = 600
+
+REMINDER_FIELDS = ("user_id", "user__telegram_chat_id", "id", "action", "time", "place")
+
+DELIVERY_BACKPRESSURE_WAIT = BACKPRESSURE_WAIT.labels(DELIVERY_QUEUE)
+
+
+def render_reminder_text(action, time, place):
+    return f"Напоминание: пора выполнить привычку '{action}' в {time.strftime('%H:%M')} в {place}."
+
+
+def build_reminders(rows):
+    """Превращает строки REMINDER_FIELDS в JSON-сериализуемые [habit_id, chat_id, text]."""
+    for user_id, chat_id, habit_id, action, habit_time, place in rows:
+        if chat_id:
+            yield [habit_id, chat_id, render_reminder_text(action, habit_time, place)]
 
 
 @shared_task
 def send_telegram_reminder(user_id, habit_id):
-    try:
-        user = User.objects.get(pk=user_id)
-        habit = Habit.objects.get(pk=habit_id)
-        chat_id = user.profile.telegram_chat_id
-
-        bot = telegram.Bot(token=TOKEN)
-        text = (
-            f"Напоминание: пора выполнить привычку '{habit.action}' в {habit.time.strftime('%H:%M')} в {habit.place}."
+    """Одно напоминание: привычка и chat_id пользователя загружаются одним запросом."""
+    rows = Habit.objects.filter(pk=habit_id, user_id=user_id).with_telegram_chat().values_list(*REMINDER_FIELDS)
+    reminders = list(build_reminders(rows))
+    if not reminders:
+        logger.warning("Нет привычки %s или chat_id у пользователя %s", habit_id, user_id)
+        return False
+
+    habit_id, chat_id, text = reminders[0]
+    error = get_delivery().send(chat_id, text)
+    if error is not None:
+        logger.error("Ошибка отправки напоминания по привычке %s: %s", habit_id, error)
+    return error is None
+
+
+@shared_task
+def send_reminder_batch(reminders, date=None, run_id=None):
+    """Отправляет пачку готовых напоминаний [habit_id, chat_id, text].
+
+    Если передан день рассылки, итог каждой отправки записывается в журнал ReminderDelivery.
+    С run_id пачка перед отправкой забирается в журнале: напоминания, которые retry_failed_reminders
+    тем временем переставил в другую рассылку, пропускаются.
+    """
+    if date is not None:
+        date = datetime.date.fromisoformat(date)
+    if date is not None and run_id is not None:
+        reminders = start_sending(reminders, date, uuid.UUID(run_id))
+    results = get_delivery().send_many(reminders)
+    if date is not None:
+        record_deliveries(results, date, run_id)
+    return sum(1 for result in results if result.error is None)
+
+
+def start_sending(reminders, date, run_id):
+    """Переводит записи пачки из pending в sending условным UPDATE и оставляет только забранные им напоминания."""
+    habit_ids = [habit_id for habit_id, chat_id, text in reminders]
+    started_at = timezone.now()
+    rows = ReminderDelivery.objects.filter(date=date, habit_id__in=habit_ids, run_id=run_id)
+    rows.filter(status=ReminderDelivery.PENDING).update(status=ReminderDelivery.SENDING, queued_at=started_at)
+    taken = set(
+        rows.filter(status=ReminderDelivery.SENDING, queued_at=started_at).values_list("habit_id", flat=True)
+    )
+    return [reminder for reminder in reminders if reminder[0] in taken]
+
+
+def record_deliveries(results, date, run_id=None):
+    results = {result.habit_id: result for result in results}
+    finished_at = timezone.now()
+    deliveries = ReminderDelivery.objects.filter(date=date, habit_id__in=results)
+    if run_id is not None:
+        deliveries = deliveries.filter(run_id=run_id, status=ReminderDelivery.SENDING)
+    deliveries = list(deliveries.only("id", "habit_id", "attempts"))
+    for delivery in deliveries:
+        result = results[delivery.habit_id]
+        delivery.status = ReminderDelivery.SENT if result.error is None else ReminderDelivery.FAILED
+        delivery.attempts += result.attempts
+        delivery.latency_ms = round(result.latency * 1000)
+        delivery.error = "" if result.error is None else str(result.error)[:255]
+        delivery.finished_at = finished_at
+    ReminderDelivery.objects.bulk_update(deliveries, ["status", "attempts", "latency_ms", "error", "finished_at"])
+
+
+def delivery_queue_length():
+    # В режиме eager (тесты, bench) очереди брокера нет
+    if current_app.conf.task_always_eager:
+        return 0
+    return queue_length(current_app, DELIVERY_QUEUE)
+
+
+def wait_for_delivery_queue():
+    """Не даёт ставить новые пачки, пока в очереди доставки больше REMINDER_QUEUE_MAX_LENGTH сообщений.
+
+    Ждёт не дольше REMINDER_BACKPRESSURE_MAX_WAIT секунд, чтобы рассылка не встала при остановленных воркерах.
+    Возвращает время ожидания в секундах.
+    """
+    waited = 0.0
+    while delivery_queue_length() > settings.REMINDER_QUEUE_MAX_LENGTH:
+        if waited >= settings.REMINDER_BACKPRESSURE_MAX_WAIT:
+            logger.warning("Очередь доставки не разгружается %.0f с, пачка ставится без ожидания", waited)
+            break
+        time.sleep(settings.REMINDER_BACKPRESSURE_INTERVAL)
+        waited += settings.REMINDER_BACKPRESSURE_INTERVAL
+    if waited:
+        DELIVERY_BACKPRESSURE_WAIT.inc(waited)
+    return waited
+
+
+def claim_reminders(batch, date, run_id):
+    """Заносит пачку в журнал и оставляет только напоминания, которые ещё никто не ставил в очередь."""
+    habit_ids = [habit_id for habit_id, chat_id, text in batch]
+    ReminderDelivery.objects.bulk_create(
+        [ReminderDelivery(habit_id=habit_id, date=date, run_id=run_id) for habit_id in habit_ids],
+        ignore_conflicts=True,
+    )
+    claimed = set(
+        ReminderDelivery.objects.filter(date=date, habit_id__in=habit_ids, run_id=run_id).values_list(
+            "habit_id", flat=True
+        )
+    )
+    return [reminder for reminder in batch if reminder[0] in claimed]
+
+
+def due_habits(date, last_id=None):
+    habits = Habit.objects.reminder_eligible().due_on(date)
+    if last_id is not None:
+        habits = habits.filter(id__lte=last_id)
+    return habits
+
+
+def iter_reminders(habits):
+    """Потоково отдаёт кортежи (user_id, chat_id, habit_id, action, time, place) по queryset привычек.
+
+    Пользователи без chat_id отсекаются в SQL только здесь, при выборке для отправки: next_due_date
+    сдвигается по всему queryset, иначе их привычки навсегда остались бы к сроку.
+    """
+    habits = habits.with_telegram_chat()
+    return habits.order_by("id").values_list(*REMINDER_FIELDS).iterator(chunk_size=REMINDER_CHUNK_SIZE)
+
+
+def iter_due_reminders(date, last_id=None):
+    return iter_reminders(due_habits(date, last_id))
+
+
+def dispatch_reminders(habits, date, run_id=None):
+    """Ставит в очередь напоминания по queryset привычек и сдвигает им next_due_date.
+
+    Повторный запуск за тот же день (ретрай задачи, двойное срабатывание beat) ничего не отправит:
+    напоминание уходит, только если эта рассылка первой создала его запись в журнале.
+    """
+    # Фиксируем верхнюю границу id, чтобы не сдвинуть дату у привычек, созданных во время рассылки.
+    last_id = Habit.objects.aggregate(last_id=Max("id"))["last_id"]
+    if last_id is None:
+        return 0
+    habits = habits.filter(id__lte=last_id)
+    run_id = run_id or uuid.uuid4()
+
+    started = time.perf_counter()
+    sent = 0
+    for batch in chunked(build_reminders(iter_reminders(habits)), settings.REMINDER_BATCH_SIZE):
+        # Ждём до записи в журнал, чтобы время в очереди не считалось зависанием для retry_failed_reminders
+        wait_for_delivery_queue()
+        batch = claim_reminders(batch, date, run_id)
+        if batch:
+            send_reminder_batch.delay(batch, date.isoformat(), str(run_id))
+            sent += len(batch)
+
+    habits.advance_due_dates(date)
+    if sent:
+        elapsed = time.perf_counter() - started
+        logger.info("Рассылка %s: в очереди %s напоминаний за %.2f с (%.0f/с)", run_id, sent, elapsed, sent / elapsed)
+    return sent
+
+
+def reminder_timezones():
+    timezones = cache.get(TIMEZONES_CACHE_KEY)
+    if timezones is None:
+        timezones = list(User.objects.order_by().values_list("timezone", flat=True).distinct())
+        cache.set(TIMEZONES_CACHE_KEY, timezones, TIMEZONES_CACHE_TIMEOUT)
+    return timezones
+
+
+def reminder_window(local_now):
+    """Интервал времени привычек для текущей минуты с запасом на пропущенные запуски (не раньше полуночи)."""
+    end = local_now.replace(second=59, microsecond=999999)
+    start = max(
+        end.replace(hour=0, minute=0, second=0, microsecond=0),
+        end - datetime.timedelta(minutes=settings.REMINDER_LOOKBACK_MINUTES, seconds=59, microseconds=999999),
+    )
+    return start.time(), end.time()
+
+
+def local_reminder_windows(now):
+    """Окна времени привычек по всем часовым поясам: список (локальная дата, окно, пояса).
+
+    Пояса с одинаковым смещением делят одно окно, так что окон столько, сколько разных смещений,
+    а дат в любой момент не больше трёх.
+    """
+    windows = collections.defaultdict(list)
+    for tz_name in reminder_timezones():
+        local_now = now.astimezone(zoneinfo.ZoneInfo(tz_name))
+        windows[local_now.date(), reminder_window(local_now)].append(tz_name)
+    return [(date, window, tz_names) for (date, window), tz_names in windows.items()]
+
+
+def local_reminder_filters(windows):
+    """Условия на время привычек, сгруппированные по локальной дате: по одному запросу на дату."""
+    filters = collections.defaultdict(Q)
+    for date, window, tz_names in windows:
+        filters[date] |= Q(time__range=window, user__timezone__in=tz_names)
+    return filters
+
+
+def run_reminder_shards(shard_task, shard_args, date):
+    """Запускает shard_task параллельно на каждом наборе аргументов; итоги собирает reminder_shards_done.
+
+    К аргументам каждого шарда добавляется общий id рассылки; он и возвращается.
+    """
+    run_id = str(uuid.uuid4())
+    chord([shard_task.s(*args, run_id) for args in shard_args])(reminder_shards_done.s(date, run_id))
+    return run_id
+
+
+@shared_task
+def dispatch_due_reminders(shards=None):
+    """Ежеминутная рассылка: напоминания по привычкам, чьё время наступило в часовом поясе пользователя.
+
+    Шарды делят между собой окна времени, а не отрезки id: окно в минуты отсекается по habit_reminder_due_idx,
+    и каждый шард читает только свои окна. Соседние по времени окна достаются разным шардам.
+    Возвращает id рассылки.
+    """
+    now = timezone.now()
+    windows = [
+        (date.isoformat(), start.isoformat(), end.isoformat(), tz_names)
+        for date, (start, end), tz_names in sorted(local_reminder_windows(now))
+    ]
+    if not windows:
+        return None
+    shards = min(shards or settings.REMINDER_SHARDS, len(windows))
+    return run_reminder_shards(
+        dispatch_due_reminder_shard, ([windows[shard::shards]] for shard in range(shards)), now.isoformat()
+    )
+
+
+@shared_task
+def dispatch_due_reminder_shard(windows, run_id):
+    """Окна шарда с одной локальной датой просматриваются одним запросом по habit_reminder_due_idx."""
+    windows = [
+        (
+            datetime.date.fromisoformat(date),
+            (datetime.time.fromisoformat(start), datetime.time.fromisoformat(end)),
+            tz_names,
         )
-        bot.send_message(chat_id=chat_id, text=text)
-    except Exception as e:
-        print(f"Ошибка отправки напоминания: {e}")
+        for date, start, end, tz_names in windows
+    ]
+    sent = 0
+    for date, time_filter in local_reminder_filters(windows).items():
+        sent += dispatch_reminders(due_habits(date).filter(time_filter), date, uuid.UUID(run_id))
+    return sent
+
+
+@shared_task
+def schedule_daily_reminders(shards=None):
+    """Рассылка по всем привычкам на сегодня без учёта времени — для ручного запуска и догоняющих прогонов.
+
+    Таблица делится на REMINDER_SHARDS отрезков id, которые параллельно просматривают воркеры Celery;
+    итоги собирает reminder_shards_done. Возвращает id рассылки.
+    """
+    today = timezone.localdate().isoformat()
+    bounds = Habit.objects.aggregate(low=Min("id"), high=Max("id"))
+    if bounds["high"] is None:
+        return None
+    ranges = split_range(bounds["low"], bounds["high"], shards or settings.REMINDER_SHARDS)
+    return run_reminder_shards(dispatch_reminder_shard, ((today, low, high) for low, high in ranges), today)
+
+
+@shared_task
+def dispatch_reminder_shard(date, low, high, run_id):
+    date = datetime.date.fromisoformat(date)
+    return dispatch_reminders(due_habits(date).filter(id__range=(low, high)), date, uuid.UUID(run_id))
+
+
+@shared_task
+def reminder_shards_done(results, date, run_id):
+    sent = sum(results)
+    logger.info("Рассылка %s за %s: %s напоминаний из %s шардов", run_id, date, sent, len(results))
+    return {"run_id": run_id, "date": date, "shards": len(results), "sent": sent}
+
+
+def pending_timeout():
+    """Сколько напоминание может ждать в очереди доставки, прежде чем считаться потерянным.
+
+    Под backpressure в очереди до REMINDER_QUEUE_MAX_LENGTH пачек (и по одной сверху от каждого шарда),
+    а общий лимит Telegram разбирает её не быстрее TELEGRAM_RATE_LIMIT сообщений в секунду: столько ждать
+    в очереди нормально. REMINDER_PENDING_TIMEOUT_MINUTES добавляется как запас.
+    """
+    queued = (settings.REMINDER_QUEUE_MAX_LENGTH + settings.REMINDER_SHARDS) * settings.REMINDER_BATCH_SIZE
+    return datetime.timedelta(
+        seconds=queued / settings.TELEGRAM_RATE_LIMIT, minutes=settings.REMINDER_PENDING_TIMEOUT_MINUTES
+    )
+
+
+@shared_task
+def retry_failed_reminders():
+    """Повторяет по журналу только неудавшиеся и зависшие напоминания за последние сутки, не просматривая привычки."""
+    now = timezone.now()
+    run_id = uuid.uuid4()
+    retryable = ReminderDelivery.objects.filter(
+        # Зависшими считаются пачки, не разобранные за время разбора полной очереди, и прерванные во время отправки
+        Q(status=ReminderDelivery.FAILED)
+        | Q(status=ReminderDelivery.PENDING, queued_at__lt=now - pending_timeout())
+        | Q(
+            status=ReminderDelivery.SENDING,
+            queued_at__lt=now - datetime.timedelta(minutes=settings.REMINDER_PENDING_TIMEOUT_MINUTES),
+        ),
+        date__gte=timezone.localdate() - datetime.timedelta(days=1),
+        attempts__lt=settings.REMINDER_MAX_ATTEMPTS,
+        habit__user__telegram_chat_id__gt="",
+    )
+    # UPDATE с тем же условием забирает записи атомарно: параллельный запуск их уже не увидит
+    claimed = retryable.update(run_id=run_id, status=ReminderDelivery.PENDING, queued_at=now)
+    if not claimed:
+        return 0
+
+    rows = (
+        ReminderDelivery.objects.filter(run_id=run_id)
+        .order_by("date", "habit_id")
+        .values_list("date", *(f"habit__{field}" for field in REMINDER_FIELDS))
+        .iterator(chunk_size=REMINDER_CHUNK_SIZE)
+    )
+    sent = 0
+    for date, group in itertools.groupby(rows, key=lambda row: row[0]):
+        reminders = build_reminders(row[1:] for row in group)
+        for batch in chunked(reminders, settings.REMINDER_BATCH_SIZE):
+            wait_for_delivery_queue()
+            send_reminder_batch.delay(batch, date.isoformat(), str(run_id))
+            sent += len(batch)
+    return sent
 
 
 @shared_task
-def schedule_daily_reminders():
-    today = datetime.date.today()
-    habits = Habit.objects.filter(is_public=False, is_pleasant=False)
-    for habit in habits:
-        delta = (today - habit.created_at.date()).days
-        if delta % habit.periodicity == 0:
-            send_telegram_reminder.delay(habit.user.id, habit.id)
+def rollup_habit_stats(date=None):
+    """Ежедневно дописывает вчерашний день в недельную и месячную статистику привычек."""
+    if date is None:
+        date = timezone.localdate() - datetime.timedelta(days=1)
+    else:
+        date = datetime.date.fromisoformat(date)
+    return rollup_day(date)
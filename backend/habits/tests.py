@@ -1,11 +1,56 @@
+import csv
 import datetime
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import fakeredis
+import redis
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from rest_framework.test import APIClient
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from django.test import AsyncClient, AsyncRequestFactory
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from django.core.exceptions import ValidationError
-from habits.models import Habit
+from habits.async_views import habit_detail, habit_list
+from habits.delivery import TOKEN_BUCKET_SCRIPT, RedisTokenBucket, TelegramDelivery, TokenBucket, create_bot
+from habits.export import aiter_chunks, iter_export_records
+from habits.models import Habit, HabitCompletion, HabitStat, ReminderDelivery
+from habits.renderers import NDJSONRenderer, ORJSONRenderer
+from habits.serializers import HabitSerializer
+from habits.stats import rollup_day
+from habits.utils import split_range
+from habits.views import HabitCursorPagination, HabitViewSet
+from habits.tasks import (
+    dispatch_due_reminder_shard,
+    dispatch_due_reminders,
+    dispatch_reminders,
+    iter_due_reminders,
+    pending_timeout,
+    retry_failed_reminders,
+    schedule_daily_reminders,
+    send_reminder_batch,
+    send_telegram_reminder,
+    wait_for_delivery_queue,
+)
+from telegram.error import BadRequest
+from users.models import localdate_in
+from users.throttling import SLIDING_WINDOW_SCRIPT, SlidingWindowRateThrottle
 
 
 User = get_user_model()
@@ -13,6 +58,7 @@ User = get_user_model()
 
 class HabitTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
 
         self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
@@ -58,6 +104,22 @@ class HabitTestCase(TestCase):
         self.assertEqual(response.status_code, 201)
         self.assertEqual(response.data["place"], "Gym")
 
+    def test_first_due_date_follows_owner_calendar(self):
+        data = {"place": "Gym", "time": "18:00:00", "action": "Workout", "execution_time": 45}
+        # 22:30 UTC 1 июля — в Москве уже 01:30 2 июля
+        now = datetime.datetime(2025, 7, 1, 22, 30, tzinfo=datetime.timezone.utc)
+        with mock.patch("django.utils.timezone.now", return_value=now):
+            created = self.client.post(reverse("habits-list"), data, format="json")
+            bulk = self.client.post(reverse("habits-bulk-create"), [data], format="json")
+            self.client.generic("POST", reverse("habit-import"), json.dumps(data).encode(), "application/x-ndjson")
+
+        self.assertEqual(created.data["next_due_date"], "2025-07-02")
+        self.assertEqual(bulk.data[0]["next_due_date"], "2025-07-02")
+        self.assertEqual(
+            set(Habit.objects.filter(action="Workout").values_list("next_due_date", flat=True)),
+            {datetime.date(2025, 7, 2)},
+        )
+
     def test_get_own_habits(self):
         url = reverse("habits-list")
         response = self.client.get(url)
@@ -94,6 +156,68 @@ class HabitTestCase(TestCase):
         self.assertEqual(len(response.data["results"]), 1)
         self.assertEqual(response.data["results"][0]["action"], self.public_habit.action)
 
+    def test_public_feed_is_served_from_cache(self):
+        url = reverse("habits-list") + "?public=true"
+        self.client.get(url)
+
+        # пользователь берётся из токена, его активность — из кэша
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["action"], self.public_habit.action)
+
+    def test_public_feed_not_modified(self):
+        url = reverse("habits-list") + "?public=true"
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_public_feed_expires_streaks_without_db_changes(self):
+        today = localdate_in(self.public_habit.user.timezone)
+        Habit.objects.filter(pk=self.public_habit.pk).update(current_streak=3, last_completed_on=today)
+        url = reverse("habits-list") + "?public=true"
+        response = self.client.get(url)
+        self.assertEqual(response.data["results"][0]["current_streak"], 3)
+
+        # серия прервалась сама по себе: ни версия ленты, ни БД не менялись
+        later = timezone.now() + datetime.timedelta(days=5)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            stale = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(stale.status_code, 200)
+        self.assertNotEqual(stale["ETag"], response["ETag"])
+        self.assertEqual(stale.data["results"][0]["current_streak"], 0)
+
+    def test_public_feed_invalidated_on_habit_changes(self):
+        url = reverse("habits-list") + "?public=true"
+        etag = self.client.get(url)["ETag"]
+
+        self.habit.is_public = True
+        self.habit.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        habit = Habit.objects.get(pk=self.public_habit.pk)
+        habit.is_public = False
+        habit.save()
+        response = self.client.get(url)
+        self.assertEqual([h["id"] for h in response.data["results"]], [self.habit.id])
+
+        self.habit.delete()
+        response = self.client.get(url)
+        self.assertEqual(response.data["results"], [])
+
+    def test_private_habit_changes_keep_public_feed_cached(self):
+        url = reverse("habits-list") + "?public=true"
+        etag = self.client.get(url)["ETag"]
+
+        self.habit.place = "Office"
+        self.habit.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
     def test_pagination(self):
         for i in range(7):
             Habit.objects.create(
@@ -113,6 +237,46 @@ class HabitTestCase(TestCase):
         self.assertEqual(len(response.data["results"]), 5)  # Страница по 5 элементов
         self.assertEqual(response.data["count"], 8)
 
+    def test_cursor_pagination(self):
+        for i in range(7):
+            Habit.objects.create(
+                user=self.user,
+                place=f"Place {i}",
+                time=datetime.time(12, 0),
+                action=f"Action {i}",
+                is_pleasant=True,
+                periodicity=1,
+                execution_time=30,
+                is_public=False,
+            )
+        url = reverse("habits-list") + "?pagination=cursor&page_size=3"
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("count", response.data)
+        first_page = [habit["id"] for habit in response.data["results"]]
+        self.assertEqual(len(first_page), 3)
+
+        # Новая привычка между запросами не сдвигает следующую страницу
+        Habit.objects.create(
+            user=self.user,
+            place="New",
+            time=datetime.time(12, 0),
+            action="New",
+            is_pleasant=True,
+            periodicity=1,
+            execution_time=30,
+            is_public=False,
+        )
+        response = self.client.get(response.data["next"])
+        second_page = [habit["id"] for habit in response.data["results"]]
+        self.assertEqual(len(second_page), 3)
+        self.assertGreater(second_page[0], first_page[-1])
+
+    def test_cursor_page_size_is_bounded(self):
+        request = Request(APIRequestFactory().get("/", {"page_size": 1000}))
+        self.assertEqual(HabitCursorPagination().get_page_size(request), HabitCursorPagination.max_page_size)
+
     def test_execution_time_too_long_raises(self):
         habit = Habit(
             user=self.user,
@@ -229,6 +393,31 @@ class HabitTestCase(TestCase):
             habit.full_clean()
         self.assertIn("Нельзя ссылаться на чужую привычку.", str(cm.exception))
 
+    def test_changed_link_owner_is_checked_with_one_query(self):
+        other_user = User.objects.create_user(email="other@example.com", password="pass1234")
+        linked = Habit.objects.create(
+            user=other_user,
+            place="Cafe",
+            time=datetime.time(14, 0),
+            action="Coffee break",
+            is_pleasant=True,
+            execution_time=15,
+        )
+        habit = Habit.objects.create(
+            user=self.user, place="Office", time=datetime.time(15, 0), action="Meeting", execution_time=40
+        )
+        habit = Habit.objects.get(pk=habit.pk)
+
+        habit.linked_habit_id = linked.id
+        with self.assertNumQueries(1), self.assertRaises(ValidationError):
+            habit.full_clean(exclude=["user", "linked_habit"])
+
+        # Связь не менялась с загрузки — владелец не запрашивается
+        Habit.objects.filter(pk=habit.pk).update(linked_habit=linked)
+        habit = Habit.objects.get(pk=habit.pk)
+        with self.assertNumQueries(0):
+            habit.clean()
+
     def test_str_method(self):
         habit = Habit.objects.create(
             user=self.user,
@@ -323,3 +512,1580 @@ class HabitTestCase(TestCase):
             is_public=False,
         )
         habit.full_clean()
+
+
+class HabitQueryCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        self.other_user = User.objects.create_user(email="user2@example.com", password="pass1234")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        self.pleasant = Habit.objects.create(
+            user=self.user,
+            place="Home",
+            time=datetime.time(9, 0),
+            action="Tea",
+            is_pleasant=True,
+            periodicity=1,
+            execution_time=30,
+        )
+        self.habit_data = {
+            "place": "Gym",
+            "time": "18:00:00",
+            "action": "Workout",
+            "periodicity": 1,
+            "execution_time": 45,
+            "linked_habit": self.pleasant.id,
+        }
+
+    def test_create_with_linked_habit(self):
+        # проверка активности пользователя, связанная привычка, часовой пояс владельца, INSERT
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse("habits-list"), self.habit_data, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_create_with_foreign_linked_habit_is_rejected(self):
+        foreign = Habit.objects.create(
+            user=self.other_user,
+            place="Cafe",
+            time=datetime.time(9, 0),
+            action="Coffee",
+            is_pleasant=True,
+            periodicity=1,
+            execution_time=30,
+        )
+        self.habit_data["linked_habit"] = foreign.id
+
+        response = self.client.post(reverse("habits-list"), self.habit_data, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("linked_habit", response.data)
+
+    def test_update(self):
+        # проверка активности пользователя, привычка, UPDATE
+        with self.assertNumQueries(3):
+            response = self.client.patch(
+                reverse("habits-detail", args=[self.pleasant.id]), {"place": "Office"}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_partial_update_is_validated_against_stored_values(self):
+        response = self.client.patch(
+            reverse("habits-detail", args=[self.pleasant.id]), {"reward": "Cake"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_retrieve(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("habits-detail", args=[self.pleasant.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_list(self):
+        for i in range(4):
+            self.client.post(reverse("habits-list"), dict(self.habit_data, action=f"Action {i}"), format="json")
+
+        # COUNT, страница: проверка активности пользователя уже в кэше
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("habits-list"))
+        self.assertEqual(len(response.data["results"]), 5)
+
+    def test_destroy(self):
+        # активность пользователя, привычка, удаление выполнений, статистики и журнала напоминаний,
+        # обнуление ссылок linked_habit, DELETE
+        with self.assertNumQueries(7):
+            response = self.client.delete(reverse("habits-detail", args=[self.pleasant.id]))
+        self.assertEqual(response.status_code, 204)
+
+
+class HabitListFastPathTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        today = timezone.localdate()
+        pleasant = Habit.objects.create(
+            user=self.user, place="Дом", time=datetime.time(7, 30), action="Чай", is_pleasant=True, execution_time=30
+        )
+        Habit.objects.create(
+            user=self.user,
+            place='Парк "Сокольники"\t\u2028\x01',
+            time=datetime.time(9, 0, 15),
+            action="Бег 🏃",
+            linked_habit=pleasant,
+            periodicity=2,
+            execution_time=60,
+            is_public=True,
+            current_streak=3,
+            longest_streak=5,
+            last_completed_on=today - datetime.timedelta(days=1),
+        )
+        Habit.objects.create(
+            user=self.user,
+            place="Office",
+            time=datetime.time(18, 0),
+            action="Stretch",
+            reward="Coffee",
+            execution_time=45,
+            current_streak=4,
+            longest_streak=4,
+            last_completed_on=today - datetime.timedelta(days=5),
+        )
+        Habit.objects.filter(pk=pleasant.pk).update(
+            created_at=datetime.datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc)
+        )
+
+    def expected_content(self, habits, **envelope):
+        return JSONRenderer().render(dict(envelope, results=HabitSerializer(habits, many=True).data))
+
+    def test_list_is_byte_identical_to_serializer(self):
+        response = self.client.get(reverse("habits-list"))
+
+        habits = Habit.objects.filter(user=self.user).order_by("id")
+        expected = self.expected_content(habits, count=3, next=None, previous=None)
+        self.assertEqual(response.content, expected)
+
+    def test_public_feed_is_byte_identical_to_serializer(self):
+        response = self.client.get(reverse("habits-list"), {"public": "true"})
+
+        habits = Habit.objects.filter(is_public=True).order_by("id")
+        expected = self.expected_content(habits, count=1, next=None, previous=None)
+        self.assertEqual(response.content, expected)
+
+    def test_cursor_page_is_byte_identical_to_serializer(self):
+        response = self.client.get(reverse("habits-list"), {"pagination": "cursor", "page_size": 2})
+
+        habits = Habit.objects.filter(user=self.user).order_by("id")[:2]
+        expected = self.expected_content(habits, next=response.data["next"], previous=None)
+        self.assertEqual(response.content, expected)
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            "text": "".join(chr(i) for i in range(32)) + '"\\/\x7f\u2028\u2029ё😀',
+            "date": datetime.date(2024, 1, 2),
+            "datetime": datetime.datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+            "time": datetime.time(9, 0),
+            "numbers": [0, -1, 2**53, 1.5, True, None],
+            1: "int key",
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class HabitExpandTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234", timezone="Asia/Tokyo")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.public_pleasant = self.create_habit(action="Чай", is_pleasant=True, is_public=True)
+        self.private_pleasant = self.create_habit(action="Музыка", is_pleasant=True)
+        self.habits = [
+            self.create_habit(action=f"Бег {i}", linked_habit=linked, is_public=True)
+            for i, linked in enumerate([self.public_pleasant, self.private_pleasant, None])
+        ]
+
+    def create_habit(self, **kwargs):
+        data = {"user": self.user, "place": "Дом", "time": datetime.time(9, 0), "execution_time": 60}
+        data.update(kwargs)
+        return Habit.objects.create(**data)
+
+    def test_linked_habits_are_embedded_in_the_list_query(self):
+        self.client.get(reverse("habits-list"))
+
+        # COUNT и одна выборка страницы, как без expand
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("habits-list"), {"expand": "linked_habit"})
+
+        self.assertEqual(response.status_code, 200)
+        results = {habit["id"]: habit for habit in response.json()["results"]}
+        for habit in self.habits:
+            expected = json.loads(JSONRenderer().render(HabitSerializer(habit).data))
+            if habit.linked_habit is not None:
+                expected["linked_habit"] = json.loads(JSONRenderer().render(HabitSerializer(habit.linked_habit).data))
+            self.assertEqual(results[habit.id], expected)
+
+    def test_query_count_does_not_grow_with_linked_habits(self):
+        self.client.get(reverse("habits-list"))
+        with self.assertNumQueries(2):
+            self.client.get(reverse("habits-list"), {"expand": "linked_habit"})
+
+        self.create_habit(action="Ещё", linked_habit=self.public_pleasant)
+        Habit.objects.filter(pk=self.habits[2].pk).update(linked_habit=self.private_pleasant)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("habits-list"), {"expand": "linked_habit"})
+
+    def test_public_feed_expands_only_public_links_and_author(self):
+        response = self.client.get(reverse("habits-list"), {"public": "true", "expand": "linked_habit,user"})
+
+        self.assertEqual(response.status_code, 200)
+        results = {habit["id"]: habit for habit in response.json()["results"]}
+        self.assertEqual(results[self.habits[0].id]["linked_habit"]["id"], self.public_pleasant.id)
+        # Приватная привычка не раскрывается в общей для всех ленте
+        self.assertEqual(results[self.habits[1].id]["linked_habit"], self.private_pleasant.id)
+        self.assertEqual(results[self.habits[2].id]["user"], {"id": self.user.id, "timezone": "Asia/Tokyo"})
+
+    def test_public_feed_cache_follows_author_changes(self):
+        params = {"public": "true", "expand": "user"}
+        self.client.get(reverse("habits-list"), params)
+
+        self.user.timezone = "Europe/Moscow"
+        self.user.save()
+
+        response = self.client.get(reverse("habits-list"), params)
+        self.assertEqual(response.json()["results"][0]["user"]["timezone"], "Europe/Moscow")
+
+    def test_public_feed_cache_survives_unrelated_user_saves(self):
+        loaded = User.objects.get(pk=self.user.pk)
+        other = User.objects.create_user(email="user2@example.com", password="pass1234")
+
+        with mock.patch("habits.signals.bump_public_feed_version") as bump:
+            loaded.telegram_chat_id = "100"
+            loaded.save()
+            loaded.last_login = timezone.now()
+            loaded.save(update_fields=["last_login"])
+            other.timezone = "Asia/Tokyo"
+            other.save()
+
+        bump.assert_not_called()
+
+    def test_unknown_expansion_is_rejected(self):
+        response = self.client.get(reverse("habits-list"), {"expand": "user"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("expand", response.json())
+
+
+class HabitExportTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        self.other_user = User.objects.create_user(email="user2@example.com", password="pass1234")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        self.habits = [
+            Habit.objects.create(
+                user=self.user, place="Дом", time=datetime.time(9, 0), action=f"Привычка {i}", execution_time=30
+            )
+            for i in range(3)
+        ]
+        foreign = Habit.objects.create(
+            user=self.other_user, place="Park", time=datetime.time(9, 0), action="Jogging", execution_time=30
+        )
+        for habit in (self.habits[0], self.habits[2], foreign):
+            for day in (3, 1):
+                HabitCompletion.objects.create(habit=habit, completed_on=datetime.date(2024, 1, day))
+
+    def export(self, **params):
+        response = self.client.get(reverse("habit-export"), params)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        response, content = self.export()
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([record["id"] for record in records], [habit.id for habit in self.habits])
+        self.assertEqual(records[0]["action"], "Привычка 0")
+        history = ["2024-01-01", "2024-01-03"]
+        self.assertEqual([record["completions"] for record in records], [history, [], history])
+
+    def test_csv_export(self):
+        response, content = self.export(format="csv")
+
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn('filename="habits.csv"', response["Content-Disposition"])
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["action"], "Привычка 0")
+        self.assertEqual(rows[0]["completions"], "2024-01-01;2024-01-03")
+        self.assertEqual(rows[1]["completions"], "")
+
+    def test_export_uses_constant_number_of_queries(self):
+        for i in range(20):
+            habit = Habit.objects.create(
+                user=self.user, place="Home", time=datetime.time(9, 0), action=f"Extra {i}", execution_time=30
+            )
+            HabitCompletion.objects.create(habit=habit, completed_on=datetime.date(2024, 1, 1))
+        self.export()
+
+        # привычки и выполнения — по одному курсору
+        with self.assertNumQueries(2):
+            response, content = self.export()
+        self.assertEqual(len(content.splitlines()), 23)
+
+    async def test_asgi_export_streams_asynchronously(self):
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.user).access_token))()
+        response = await AsyncClient().get(reverse("habit-export"), headers={"Authorization": f"Bearer {token}"})
+
+        # асинхронный итератор отдаётся как есть, без сборки всей выгрузки в список
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        records = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+        self.assertEqual([record["id"] for record in records], [habit.id for habit in self.habits])
+
+    async def test_asgi_export_reads_records_in_chunks(self):
+        content = NDJSONRenderer().stream(iter_export_records(self.user.id))
+        chunks = [chunk async for chunk in aiter_chunks(content, size=2)]
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(len(b"".join(chunks).splitlines()), 3)
+
+    def test_export_requires_authentication(self):
+        self.client.credentials()
+        response = self.client.get(reverse("habit-export"))
+        self.assertEqual(response.status_code, 401)
+
+
+class HabitImportTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+    def post_import(self, content, content_type="application/x-ndjson"):
+        return self.client.generic("POST", reverse("habit-import"), content.encode(), content_type=content_type)
+
+    def ndjson(self, *records):
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    def test_import_resolves_links_within_file(self):
+        content = self.ndjson(
+            {"id": 10, "place": "Gym", "time": "18:00", "action": "Workout", "execution_time": 60, "linked_habit": 20},
+            {"id": 20, "place": "Home", "time": "19:00", "action": "Tea", "execution_time": 30, "is_pleasant": True},
+            {"id": 30, "place": "Park", "time": "07:00", "action": "Run", "execution_time": 90, "linked_habit": 20},
+        )
+
+        response = self.post_import(content)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 3)
+        tea = Habit.objects.get(action="Tea")
+        self.assertEqual(Habit.objects.get(action="Workout").linked_habit_id, tea.id)
+        self.assertEqual(Habit.objects.get(action="Run").linked_habit_id, tea.id)
+        self.assertEqual(set(Habit.objects.values_list("user_id", flat=True)), {self.user.id})
+
+    def test_invalid_rows_roll_back_whole_import(self):
+        content = self.ndjson(
+            {"place": "Gym", "time": "18:00", "action": "Workout", "execution_time": 60},
+            {"place": "Home", "time": "19:00", "action": "Tea", "execution_time": 500},
+            {"place": "Park", "time": "07:00", "action": "Run", "execution_time": 90, "linked_habit": 99},
+        ) + "not json\n"
+
+        response = self.post_import(content)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["line"] for error in response.data["errors"]], [2, 4])
+        self.assertFalse(Habit.objects.exists())
+
+    def test_error_lines_are_physical_file_lines(self):
+        workout = self.ndjson({"place": "Gym", "time": "18:00", "action": "Workout", "execution_time": 60})
+        invalid = self.ndjson({"place": "Home", "time": "19:00", "action": "Tea", "execution_time": 500})
+        # Пустые строки пропускаются, но нумерация по ним не сбивается
+        response = self.post_import("\n" + workout + "\n" + invalid)
+        self.assertEqual([error["line"] for error in response.data["errors"]], [4])
+
+        # В CSV первая строка — заголовок
+        content = "place,time,action,execution_time\nGym,18:00,Workout,60\n\nHome,19:00,Tea,500\n"
+        response = self.post_import(content, "text/csv")
+        self.assertEqual([error["line"] for error in response.data["errors"]], [4])
+
+    def test_link_must_point_to_pleasant_habit_in_file(self):
+        content = self.ndjson(
+            {"id": 1, "place": "Gym", "time": "18:00", "action": "Workout", "execution_time": 60, "linked_habit": 2},
+            {"id": 2, "place": "Park", "time": "07:00", "action": "Run", "execution_time": 90, "linked_habit": 3},
+        )
+
+        response = self.post_import(content)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["line"] for error in response.data["errors"]], [1, 2])
+        self.assertFalse(Habit.objects.exists())
+
+    def test_export_can_be_imported_back(self):
+        other = User.objects.create_user(email="user2@example.com", password="pass1234")
+        tea = Habit.objects.create(
+            user=other, place="Дом", time=datetime.time(19, 0), action="Чай", is_pleasant=True, execution_time=30
+        )
+        workout = Habit.objects.create(
+            user=other, place="Gym", time=datetime.time(18, 0), action="Workout", linked_habit=tea, execution_time=60
+        )
+        for day in (1, 2, 4):
+            HabitCompletion.objects.create(habit=workout, completed_on=datetime.date(2024, 1, day))
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(other).access_token}")
+        export = other_client.get(reverse("habit-export"), {"format": "csv"})
+
+        response = self.post_import(b"".join(export.streaming_content).decode(), "text/csv")
+
+        self.assertEqual(response.status_code, 201)
+        imported = Habit.objects.get(user=self.user, action="Workout")
+        self.assertEqual(imported.linked_habit.action, "Чай")
+        self.assertEqual(imported.current_streak, 1)
+        self.assertEqual(imported.longest_streak, 2)
+        self.assertEqual(imported.last_completed_on, datetime.date(2024, 1, 4))
+        self.assertEqual(imported.completions.count(), 3)
+
+    def test_unsupported_content_type(self):
+        response = self.client.post(reverse("habit-import"), [], format="json")
+        self.assertEqual(response.status_code, 415)
+
+    def test_import_command(self):
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "habits.csv")
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["place", "time", "action", "execution_time", "is_pleasant"])
+                for i in range(25):
+                    writer.writerow(["Home", "09:00", f"Action {i}", 30, "False"])
+
+            call_command("import_habits", path, user="user1@example.com", batch_size=10, stdout=out)
+
+        self.assertIn("imported 25 habits", out.getvalue())
+        self.assertEqual(Habit.objects.filter(user=self.user).count(), 25)
+
+
+class HabitCompletionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        self.habit = Habit.objects.create(
+            user=self.user,
+            place="Home",
+            time=datetime.time(9, 0),
+            action="Read book",
+            periodicity=2,
+            execution_time=30,
+        )
+        self.url = reverse("habits-complete", args=[self.habit.id])
+        self.today = localdate_in(self.user.timezone)
+
+    def complete(self, days_ago):
+        date = self.today - datetime.timedelta(days=days_ago)
+        return self.client.post(self.url, {"completed_on": date.isoformat()}, format="json")
+
+    def test_streak_grows_within_periodicity(self):
+        self.complete(4)
+        self.complete(2)
+        response = self.complete(0)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["current_streak"], 3)
+        self.assertEqual(response.data["longest_streak"], 3)
+        self.assertEqual(HabitCompletion.objects.filter(habit=self.habit).count(), 3)
+
+    def test_missed_period_resets_streak(self):
+        self.complete(6)
+        self.complete(5)
+        response = self.complete(0)
+
+        self.assertEqual(response.data["current_streak"], 1)
+        self.assertEqual(response.data["longest_streak"], 2)
+
+    def test_streak_is_shown_as_broken_after_missed_period(self):
+        self.complete(5)
+
+        response = self.client.get(reverse("habits-detail", args=[self.habit.id]))
+
+        self.assertEqual(response.data["current_streak"], 0)
+        self.assertEqual(response.data["longest_streak"], 1)
+
+    def test_same_day_check_in_is_idempotent(self):
+        self.complete(0)
+        response = self.complete(0)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["current_streak"], 1)
+        self.assertEqual(HabitCompletion.objects.filter(habit=self.habit).count(), 1)
+
+    def test_check_in_defaults_to_today(self):
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["last_completed_on"], self.today.isoformat())
+
+    def test_check_in_follows_owner_calendar_at_day_boundary(self):
+        other = Habit.objects.create(
+            user=self.user, place="Park", time=datetime.time(7, 0), action="Run", periodicity=2, execution_time=60
+        )
+        # 22:30 UTC 1 июля — в Москве уже 01:30 2 июля
+        now = datetime.datetime(2025, 7, 1, 22, 30, tzinfo=datetime.timezone.utc)
+        with mock.patch("django.utils.timezone.now", return_value=now):
+            explicit = self.client.post(self.url, {"completed_on": "2025-07-02"}, format="json")
+            default = self.client.post(reverse("habits-complete", args=[other.id]))
+
+        self.assertEqual(explicit.status_code, 201)
+        self.assertEqual(default.data["last_completed_on"], "2025-07-02")
+
+        # 22:30 UTC 4 июля: по UTC с выполнения прошло два дня, по Москве уже три — серия прервана
+        with mock.patch("django.utils.timezone.now", return_value=now + datetime.timedelta(days=3)):
+            detail = self.client.get(reverse("habits-detail", args=[self.habit.id]))
+            listed = self.client.get(reverse("habits-list"))
+
+        self.assertEqual(detail.data["current_streak"], 0)
+        self.assertEqual({habit["current_streak"] for habit in listed.json()["results"]}, {0})
+
+    def test_rejects_dates_before_last_completion_and_in_future(self):
+        self.complete(0)
+
+        self.assertEqual(self.complete(1).status_code, 400)
+        self.assertEqual(self.complete(-1).status_code, 400)
+
+    def test_cannot_complete_foreign_habit(self):
+        other_user = User.objects.create_user(email="user2@example.com", password="pass1234")
+        self.habit.user = other_user
+        self.habit.is_public = True
+        self.habit.save()
+
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, 403)
+
+
+class HabitStatsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        self.habit = Habit.objects.create(
+            user=self.user,
+            place="Home",
+            time=datetime.time(9, 0),
+            action="Read book",
+            periodicity=2,
+            execution_time=30,
+        )
+        Habit.objects.filter(pk=self.habit.pk).update(
+            created_at=datetime.datetime(2025, 6, 1, tzinfo=datetime.timezone.utc)
+        )
+        # понедельник
+        self.monday = datetime.date(2025, 7, 14)
+
+    def complete(self, date):
+        HabitCompletion.objects.create(habit=self.habit, completed_on=date)
+
+    def test_rollup_adds_one_day_per_run(self):
+        self.complete(self.monday)
+        rollup_day(self.monday)
+        rollup_day(self.monday + datetime.timedelta(days=1))
+
+        week = HabitStat.objects.get(habit=self.habit, period=HabitStat.WEEK)
+        self.assertEqual(week.period_start, self.monday)
+        self.assertEqual((week.days_tracked, week.completions), (2, 1))
+        month = HabitStat.objects.get(habit=self.habit, period=HabitStat.MONTH)
+        self.assertEqual(month.period_start, datetime.date(2025, 7, 1))
+        self.assertEqual((month.days_tracked, month.completions), (2, 1))
+
+    def test_rollup_is_idempotent(self):
+        self.complete(self.monday)
+        rollup_day(self.monday)
+        rollup_day(self.monday)
+
+        week = HabitStat.objects.get(habit=self.habit, period=HabitStat.WEEK)
+        self.assertEqual((week.days_tracked, week.completions), (1, 1))
+
+    def test_missed_days_are_caught_up_across_periods(self):
+        sunday = self.monday - datetime.timedelta(days=1)
+        rollup_day(sunday - datetime.timedelta(days=1))
+        self.complete(sunday)
+        self.complete(self.monday + datetime.timedelta(days=1))
+
+        # Запуски за воскресенье и понедельник пропущены
+        rollup_day(self.monday + datetime.timedelta(days=1))
+
+        weeks = HabitStat.objects.filter(habit=self.habit, period=HabitStat.WEEK).order_by("period_start")
+        self.assertEqual(
+            [(week.period_start, week.days_tracked, week.completions, week.rolled_up_to) for week in weeks],
+            [
+                (self.monday - datetime.timedelta(weeks=1), 2, 1, sunday),
+                (self.monday, 2, 1, self.monday + datetime.timedelta(days=1)),
+            ],
+        )
+        month = HabitStat.objects.get(habit=self.habit, period=HabitStat.MONTH)
+        self.assertEqual((month.days_tracked, month.completions), (4, 2))
+
+    def test_habits_created_later_are_not_counted(self):
+        Habit.objects.filter(pk=self.habit.pk).update(
+            created_at=datetime.datetime(2025, 8, 1, tzinfo=datetime.timezone.utc)
+        )
+
+        rollup_day(self.monday)
+
+        self.assertFalse(HabitStat.objects.exists())
+
+    def test_stats_endpoint(self):
+        for day in range(4):
+            date = self.monday + datetime.timedelta(days=day)
+            if day % 2 == 0:
+                self.complete(date)
+            rollup_day(date)
+
+        response = self.client.get(reverse("habit-stats"), {"period": "week", "date": "2025-07-17"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["period_start"], self.monday)
+        self.assertEqual(response.data["rolled_up_to"], datetime.date(2025, 7, 17))
+        (stat,) = response.data["habits"]
+        self.assertEqual(stat["habit"], self.habit.id)
+        self.assertEqual(stat["completions"], 2)
+        self.assertEqual(stat["expected_completions"], 2)
+        self.assertEqual(stat["completion_rate"], 1.0)
+
+    def test_stats_read_does_not_depend_on_history_length(self):
+        HabitStat.objects.bulk_create(
+            [
+                HabitStat(
+                    habit=self.habit,
+                    user=self.user,
+                    period=HabitStat.WEEK,
+                    period_start=self.monday - datetime.timedelta(weeks=weeks),
+                    days_tracked=7,
+                    completions=4,
+                    rolled_up_to=self.monday - datetime.timedelta(weeks=weeks - 1, days=1),
+                )
+                for weeks in range(1, 500)
+            ]
+        )
+        # аутентификация и одна выборка по индексу (user, period, period_start)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("habit-stats"), {"period": "week", "date": "2025-07-10"})
+        self.assertEqual(len(response.data["habits"]), 1)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(reverse("habit-stats"), {"period": "year"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("habit-stats"), {"date": "yesterday"}).status_code, 400)
+
+
+class AsyncReadViewsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        self.other_user = User.objects.create_user(email="user2@example.com", password="pass1234")
+        self.auth = f"Bearer {RefreshToken.for_user(self.user).access_token}"
+        self.client.credentials(HTTP_AUTHORIZATION=self.auth)
+        self.habits = [
+            Habit.objects.create(
+                user=self.user,
+                place=f"Place {i}",
+                time=datetime.time(9, 0),
+                action=f"Action {i}",
+                periodicity=1,
+                execution_time=30,
+            )
+            for i in range(12)
+        ]
+        self.private_foreign = Habit.objects.create(
+            user=self.other_user,
+            place="Cafe",
+            time=datetime.time(9, 0),
+            action="Coffee",
+            is_pleasant=True,
+            periodicity=1,
+            execution_time=30,
+        )
+        self.factory = AsyncRequestFactory()
+
+    async def assertSameAsSync(self, view, path, **kwargs):
+        response = await view(self.factory.get(path, headers={"Authorization": self.auth}), **kwargs)
+        sync_response = await sync_to_async(self.client.get)(path)
+        self.assertEqual(response.status_code, sync_response.status_code)
+        self.assertEqual(response.content, sync_response.content)
+        return response
+
+    async def test_list_pages_match_sync_view(self):
+        url = reverse("habits-list")
+        for query in ("", "?page=2", "?page=3", "?page=4"):
+            await self.assertSameAsSync(habit_list, url + query)
+
+    async def test_retrieve_matches_sync_view(self):
+        await self.assertSameAsSync(habit_detail, f"/api/habits/habits/{self.habits[0].id}/", pk=self.habits[0].id)
+        response = await self.assertSameAsSync(
+            habit_detail, f"/api/habits/habits/{self.private_foreign.id}/", pk=self.private_foreign.id
+        )
+        self.assertEqual(response.status_code, 403)
+
+    async def test_unauthenticated_request_is_rejected(self):
+        response = await habit_list(self.factory.get(reverse("habits-list")))
+        self.assertEqual(response.status_code, 401)
+
+        request = self.factory.get(reverse("habits-list"), headers={"Authorization": "Bearer broken"})
+        response = await habit_list(request)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_async_reads_apply_viewset_throttles(self):
+        fake_redis = fakeredis.FakeStrictRedis()
+        patches = [
+            mock.patch.object(HabitViewSet, "throttle_classes", [SlidingWindowRateThrottle]),
+            mock.patch.object(SlidingWindowRateThrottle, "THROTTLE_RATES", {"user": "2/m"}),
+            mock.patch(
+                "users.throttling.get_sliding_window_script",
+                return_value=fake_redis.register_script(SLIDING_WINDOW_SCRIPT),
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        headers = {"Authorization": self.auth}
+        list_response = await habit_list(self.factory.get(reverse("habits-list"), headers=headers))
+        detail_url = f"/api/habits/habits/{self.habits[0].id}/"
+        detail_response = await habit_detail(self.factory.get(detail_url, headers=headers), pk=self.habits[0].id)
+        throttled = await habit_list(self.factory.get(reverse("habits-list"), headers=headers))
+
+        self.assertEqual((list_response.status_code, detail_response.status_code), (200, 200))
+        self.assertEqual(throttled.status_code, 429)
+        self.assertEqual(throttled["Retry-After"], "60")
+
+    async def test_writes_are_delegated_to_viewset(self):
+        url = f"/api/habits/habits/{self.habits[0].id}/"
+        request = self.factory.delete(url, headers={"Authorization": self.auth})
+        response = await habit_detail(request, pk=self.habits[0].id)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await Habit.objects.filter(pk=self.habits[0].id).aexists())
+
+
+class HabitBulkTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        self.other_user = User.objects.create_user(email="user2@example.com", password="pass1234")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        self.url = reverse("habits-bulk-create")
+        self.pleasant = Habit.objects.create(
+            user=self.user,
+            place="Home",
+            time=datetime.time(9, 0),
+            action="Tea",
+            is_pleasant=True,
+            periodicity=1,
+            execution_time=30,
+        )
+
+    def habit_data(self, i, **kwargs):
+        data = {
+            "place": f"Place {i}",
+            "time": "18:00:00",
+            "action": f"Action {i}",
+            "is_pleasant": False,
+            "periodicity": 1,
+            "execution_time": 45,
+        }
+        data.update(kwargs)
+        return data
+
+    def test_bulk_create_uses_constant_number_of_queries(self):
+        items = [self.habit_data(i, linked_habit=self.pleasant.id) for i in range(50)]
+
+        # аутентификация, связанные привычки, часовой пояс владельца, транзакция с одним INSERT
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url, items, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 50)
+        self.assertEqual(Habit.objects.filter(user=self.user, linked_habit=self.pleasant).count(), 50)
+
+    def test_bulk_create_reports_per_item_errors(self):
+        foreign = Habit.objects.create(
+            user=self.other_user,
+            place="Cafe",
+            time=datetime.time(9, 0),
+            action="Coffee",
+            is_pleasant=True,
+            periodicity=1,
+            execution_time=30,
+        )
+        items = [
+            self.habit_data(0),
+            self.habit_data(1, execution_time=130),
+            self.habit_data(2, linked_habit=foreign.id),
+        ]
+
+        response = self.client.post(self.url, items, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("non_field_errors", response.data[1])
+        self.assertIn("linked_habit", response.data[2])
+        self.assertFalse(Habit.objects.filter(action="Action 0").exists())
+
+    def test_bulk_create_rejects_too_many_items(self):
+        with self.settings(HABIT_BULK_MAX_ITEMS=2):
+            response = self.client.post(self.url, [self.habit_data(i) for i in range(3)], format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_update(self):
+        habits = Habit.objects.bulk_create(
+            [
+                Habit(
+                    user=self.user,
+                    place="Home",
+                    time=datetime.time(9, 0),
+                    action=f"Action {i}",
+                    execution_time=30,
+                    next_due_date=datetime.date(2025, 7, 20),
+                )
+                for i in range(3)
+            ]
+        )
+        items = [{"id": habit.id, "place": "Office"} for habit in habits]
+        items.append({"id": 999999, "place": "Nowhere"})
+
+        response = self.client.patch(self.url, items, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[:3], [{}, {}, {}])
+        self.assertIn("id", response.data[3])
+
+        response = self.client.patch(self.url, items[:3], format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Habit.objects.filter(place="Office").count(), 3)
+
+    def test_bulk_update_validates_merged_habit(self):
+        items = [{"id": self.pleasant.id, "reward": "Cake"}]
+
+        response = self.client.patch(self.url, items, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("non_field_errors", response.data[0])
+
+    def test_bulk_delete_only_own_habits(self):
+        foreign = Habit.objects.create(
+            user=self.other_user,
+            place="Cafe",
+            time=datetime.time(9, 0),
+            action="Coffee",
+            is_pleasant=True,
+            periodicity=1,
+            execution_time=30,
+        )
+
+        response = self.client.delete(self.url, {"ids": [self.pleasant.id, foreign.id]}, format="json")
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Habit.objects.filter(id=self.pleasant.id).exists())
+        self.assertTrue(Habit.objects.filter(id=foreign.id).exists())
+
+    def test_bulk_create_invalidates_public_feed(self):
+        feed_url = reverse("habits-list") + "?public=true"
+        etag = self.client.get(feed_url)["ETag"]
+
+        self.client.post(self.url, [self.habit_data(0, is_public=True)], format="json")
+
+        response = self.client.get(feed_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 1)
+
+
+class ScheduleDailyRemindersTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234", telegram_chat_id="100")
+        self.today = datetime.date(2025, 7, 20)
+
+    def create_habit(self, **kwargs):
+        data = {
+            "user": self.user,
+            "place": "Home",
+            "time": datetime.time(9, 0),
+            "action": "Read book",
+            "is_pleasant": False,
+            "periodicity": 1,
+            "execution_time": 30,
+            "is_public": False,
+            "next_due_date": self.today,
+        }
+        data.update(kwargs)
+        return Habit.objects.create(**data)
+
+    def run_schedule(self):
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today), mock.patch(
+            "habits.tasks.send_reminder_batch.delay"
+        ) as delay:
+            schedule_daily_reminders(shards=1)
+        return delay
+
+    def test_scan_is_split_into_shards(self):
+        habits = [self.create_habit() for _ in range(7)]
+        self.create_habit(is_pleasant=True)
+
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today), mock.patch(
+            "habits.tasks.send_reminder_batch.delay"
+        ) as delay, mock.patch("habits.tasks.logger.info") as log, self.settings(REMINDER_SHARDS=3):
+            run_id = schedule_daily_reminders()
+
+        batches = [[habit_id for habit_id, chat_id, text in call.args[0]] for call in delay.call_args_list]
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(sorted(sum(batches, [])), [habit.id for habit in habits])
+        self.assertEqual(set(ReminderDelivery.objects.values_list("run_id", flat=True)), {uuid.UUID(run_id)})
+        log.assert_called_with("Рассылка %s за %s: %s напоминаний из %s шардов", run_id, "2025-07-20", 7, 3)
+
+    def test_only_due_reminder_eligible_habits_are_sent(self):
+        due = self.create_habit()
+        overdue = self.create_habit(next_due_date=self.today - datetime.timedelta(days=2))
+        self.create_habit(next_due_date=self.today + datetime.timedelta(days=1))
+        self.create_habit(is_pleasant=True)
+        self.create_habit(is_public=True)
+
+        delay = self.run_schedule()
+
+        delay.assert_called_once()
+        batch, date, run_id = delay.call_args.args
+        self.assertEqual([habit_id for habit_id, chat_id, text in batch], [due.id, overdue.id])
+        self.assertEqual(batch[0][1], "100")
+        self.assertEqual(batch[0][2], "Напоминание: пора выполнить привычку 'Read book' в 09:00 в Home.")
+        self.assertEqual(date, self.today.isoformat())
+
+    def test_reminders_are_split_into_batches(self):
+        for _ in range(5):
+            self.create_habit()
+
+        with self.settings(REMINDER_BATCH_SIZE=2):
+            delay = self.run_schedule()
+
+        self.assertEqual([len(call.args[0]) for call in delay.call_args_list], [2, 2, 1])
+
+    def test_users_without_chat_id_are_skipped(self):
+        no_chat = User.objects.create_user(email="user2@example.com", password="pass1234")
+        self.create_habit(user=no_chat)
+
+        delay = self.run_schedule()
+
+        delay.assert_not_called()
+
+    def test_due_dates_advance_by_periodicity(self):
+        daily = self.create_habit()
+        weekly = self.create_habit(periodicity=7)
+
+        self.run_schedule()
+
+        daily.refresh_from_db()
+        weekly.refresh_from_db()
+        self.assertEqual(daily.next_due_date, self.today + datetime.timedelta(days=1))
+        self.assertEqual(weekly.next_due_date, self.today + datetime.timedelta(days=7))
+
+    def test_second_run_on_same_day_sends_nothing(self):
+        self.create_habit()
+        self.run_schedule()
+
+        delay = self.run_schedule()
+
+        delay.assert_not_called()
+
+
+class ReminderDeliveryLedgerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234", telegram_chat_id="100")
+        self.today = datetime.date(2025, 7, 20)
+        self.habits = [
+            Habit.objects.create(
+                user=self.user,
+                place="Home",
+                time=datetime.time(9, 0),
+                action=f"Action {i}",
+                execution_time=30,
+                next_due_date=self.today,
+            )
+            for i in range(3)
+        ]
+
+    def run_schedule(self):
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today), mock.patch(
+            "habits.tasks.send_reminder_batch.delay"
+        ) as delay:
+            schedule_daily_reminders()
+        return [habit_id for call in delay.call_args_list for habit_id, chat_id, text in call.args[0]]
+
+    def stale_queued_at(self):
+        return timezone.now() - pending_timeout() - datetime.timedelta(minutes=1)
+
+    def test_repeated_dispatch_sends_each_reminder_once(self):
+        self.assertEqual(self.run_schedule(), [habit.id for habit in self.habits])
+
+        # Рассылка упала до сдвига next_due_date и запущена повторно
+        Habit.objects.update(next_due_date=self.today)
+        self.assertEqual(self.run_schedule(), [])
+        self.assertEqual(ReminderDelivery.objects.filter(date=self.today).count(), 3)
+
+    def test_batch_results_are_recorded(self):
+        self.run_schedule()
+        bot = mock.Mock()
+        bot.send_message.side_effect = [None, BadRequest("chat not found"), None]
+        delivery = TelegramDelivery(bot, max_concurrency=1, sleep=lambda seconds: None)
+        reminders = [[habit.id, "100", "text"] for habit in self.habits]
+
+        with mock.patch("habits.tasks.get_delivery", return_value=delivery), self.assertLogs("habits.delivery"):
+            sent = send_reminder_batch(reminders, self.today.isoformat())
+
+        self.assertEqual(sent, 2)
+        deliveries = {d.habit_id: d for d in ReminderDelivery.objects.all()}
+        self.assertEqual(deliveries[self.habits[0].id].status, ReminderDelivery.SENT)
+        self.assertEqual(deliveries[self.habits[1].id].status, ReminderDelivery.FAILED)
+        self.assertEqual(deliveries[self.habits[1].id].error, "chat not found")
+        self.assertEqual({d.attempts for d in deliveries.values()}, {1})
+        self.assertTrue(all(d.finished_at and d.latency_ms is not None for d in deliveries.values()))
+
+        summary = ReminderDelivery.objects.run_summary(deliveries[self.habits[0].id].run_id)
+        self.assertEqual((summary["total"], summary["sent"], summary["failed"]), (3, 2, 1))
+
+    def test_retry_targets_only_failed_and_stale_rows(self):
+        self.run_schedule()
+        failed, stale, sent = self.habits
+        ReminderDelivery.objects.filter(habit=failed).update(status=ReminderDelivery.FAILED, attempts=1)
+        ReminderDelivery.objects.filter(habit=stale).update(queued_at=self.stale_queued_at())
+        ReminderDelivery.objects.filter(habit=sent).update(status=ReminderDelivery.SENT, attempts=1)
+
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today), mock.patch(
+            "habits.tasks.send_reminder_batch.delay"
+        ) as delay, self.assertNumQueries(2):
+            retried = retry_failed_reminders()
+
+        self.assertEqual(retried, 2)
+        (batch, date, run_id), = [call.args for call in delay.call_args_list]
+        self.assertEqual([habit_id for habit_id, chat_id, text in batch], [failed.id, stale.id])
+        self.assertEqual(date, self.today.isoformat())
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today):
+            self.assertEqual(retry_failed_reminders(), 0)
+
+    def test_stale_batch_resent_by_retry_is_delivered_once(self):
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today), mock.patch(
+            "habits.tasks.send_reminder_batch.delay"
+        ) as delay:
+            schedule_daily_reminders(shards=1)
+        (original,) = [call.args for call in delay.call_args_list]
+
+        # Первая пачка всё ещё ждёт в очереди, а retry_failed_reminders уже считает её зависшей
+        ReminderDelivery.objects.update(queued_at=self.stale_queued_at())
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today), mock.patch(
+            "habits.tasks.send_reminder_batch.delay"
+        ) as delay:
+            retry_failed_reminders()
+        (retried,) = [call.args for call in delay.call_args_list]
+
+        bot = mock.Mock()
+        delivery = TelegramDelivery(bot, max_concurrency=1, sleep=lambda seconds: None)
+        with mock.patch("habits.tasks.get_delivery", return_value=delivery):
+            self.assertEqual(send_reminder_batch(*original), 0)
+            self.assertEqual(send_reminder_batch(*retried), 3)
+            # Повторная доставка того же сообщения брокером тоже ничего не отправит
+            self.assertEqual(send_reminder_batch(*retried), 0)
+
+        self.assertEqual(bot.send_message.call_count, 3)
+        self.assertEqual(
+            set(ReminderDelivery.objects.values_list("status", "attempts")), {(ReminderDelivery.SENT, 1)}
+        )
+
+    @override_settings(
+        REMINDER_QUEUE_MAX_LENGTH=200,
+        REMINDER_SHARDS=8,
+        REMINDER_BATCH_SIZE=500,
+        TELEGRAM_RATE_LIMIT=30,
+        REMINDER_PENDING_TIMEOUT_MINUTES=15,
+    )
+    def test_batch_waiting_in_full_queue_is_not_reenqueued(self):
+        self.run_schedule()
+        # Полная очередь из 208 пачек по 500 разбирается при 30 сообщениях в секунду почти час
+        self.assertEqual(pending_timeout(), datetime.timedelta(seconds=208 * 500 / 30, minutes=15))
+        ReminderDelivery.objects.update(queued_at=timezone.now() - datetime.timedelta(minutes=55))
+
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today), mock.patch(
+            "habits.tasks.send_reminder_batch.delay"
+        ) as delay:
+            self.assertEqual(retry_failed_reminders(), 0)
+
+        delay.assert_not_called()
+        self.assertEqual(set(ReminderDelivery.objects.values_list("status", flat=True)), {ReminderDelivery.PENDING})
+
+    def test_retry_sweep_skips_batches_being_sent(self):
+        self.run_schedule()
+        ReminderDelivery.objects.update(status=ReminderDelivery.SENDING, queued_at=timezone.now())
+
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today):
+            self.assertEqual(retry_failed_reminders(), 0)
+
+        ReminderDelivery.objects.update(queued_at=timezone.now() - datetime.timedelta(hours=1))
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today), mock.patch(
+            "habits.tasks.send_reminder_batch.delay"
+        ):
+            self.assertEqual(retry_failed_reminders(), 3)
+
+    def test_retries_stop_after_max_attempts(self):
+        self.run_schedule()
+        ReminderDelivery.objects.update(status=ReminderDelivery.FAILED, attempts=10)
+
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today), self.settings(
+            REMINDER_MAX_ATTEMPTS=10
+        ):
+            self.assertEqual(retry_failed_reminders(), 0)
+
+
+class DispatchDueRemindersTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tokyo_user = User.objects.create_user(
+            email="tokyo@example.com", password="pass1234", telegram_chat_id="1", timezone="Asia/Tokyo"
+        )
+        self.moscow_user = User.objects.create_user(
+            email="moscow@example.com", password="pass1234", telegram_chat_id="2"
+        )
+        # 00:00 UTC — 09:00 в Токио и 03:00 в Москве
+        self.now = datetime.datetime(2025, 7, 20, 0, 0, 20, tzinfo=datetime.timezone.utc)
+
+    def create_habit(self, user, time, **kwargs):
+        data = {
+            "user": user,
+            "place": "Home",
+            "time": time,
+            "action": "Read book",
+            "periodicity": 1,
+            "execution_time": 30,
+            "next_due_date": datetime.date(2025, 7, 20),
+        }
+        data.update(kwargs)
+        return Habit.objects.create(**data)
+
+    def run_dispatch(self, now=None, shards=None):
+        with mock.patch("habits.tasks.timezone.now", return_value=now or self.now), mock.patch(
+            "habits.tasks.send_reminder_batch.delay"
+        ) as delay:
+            dispatch_due_reminders(shards)
+        return sorted(habit_id for call in delay.call_args_list for habit_id, chat_id, text in call.args[0])
+
+    def test_habits_fire_at_their_local_time(self):
+        on_time = self.create_habit(self.tokyo_user, datetime.time(9, 0))
+        self.create_habit(self.tokyo_user, datetime.time(9, 1))
+        self.create_habit(self.moscow_user, datetime.time(9, 0))
+        moscow_on_time = self.create_habit(self.moscow_user, datetime.time(3, 0))
+
+        self.assertEqual(self.run_dispatch(), [on_time.id, moscow_on_time.id])
+
+    def test_missed_minutes_are_caught_up_within_lookback(self):
+        recent = self.create_habit(self.tokyo_user, datetime.time(8, 50))
+        self.create_habit(self.tokyo_user, datetime.time(8, 30))
+
+        self.assertEqual(self.run_dispatch(), [recent.id])
+
+    def test_habit_is_sent_once_per_day(self):
+        habit = self.create_habit(self.tokyo_user, datetime.time(9, 0))
+
+        self.assertEqual(self.run_dispatch(), [habit.id])
+        self.assertEqual(self.run_dispatch(self.now + datetime.timedelta(seconds=30)), [])
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_due_date, datetime.date(2025, 7, 21))
+
+    def test_timezones_with_same_local_date_are_scanned_in_one_query(self):
+        london_user = User.objects.create_user(
+            email="london@example.com", password="pass1234", telegram_chat_id="3", timezone="Europe/London"
+        )
+        tokyo = self.create_habit(self.tokyo_user, datetime.time(9, 0))
+        moscow = self.create_habit(self.moscow_user, datetime.time(3, 0))
+        london = self.create_habit(london_user, datetime.time(1, 0))
+
+        with mock.patch("habits.tasks.dispatch_reminders", wraps=dispatch_reminders) as dispatch:
+            self.assertEqual(self.run_dispatch(shards=1), sorted([tokyo.id, moscow.id, london.id]))
+        self.assertEqual(dispatch.call_count, 1)
+
+    def test_time_windows_are_split_into_shards(self):
+        london_user = User.objects.create_user(
+            email="london@example.com", password="pass1234", telegram_chat_id="3", timezone="Europe/London"
+        )
+        habits = [self.create_habit(self.tokyo_user, datetime.time(9, 0)) for _ in range(2)]
+        habits.append(self.create_habit(self.moscow_user, datetime.time(3, 0)))
+        habits.append(self.create_habit(london_user, datetime.time(1, 0)))
+
+        with mock.patch("habits.tasks.dispatch_due_reminder_shard.s", wraps=dispatch_due_reminder_shard.s) as shard:
+            self.assertEqual(self.run_dispatch(shards=2), sorted(habit.id for habit in habits))
+        # каждый шард читает только свои окна по индексу, без отрезков id
+        shard_timezones = [sorted(tz for window in call.args[0] for tz in window[3]) for call in shard.call_args_list]
+        self.assertEqual(sorted(shard_timezones), [["Asia/Tokyo", "Europe/London"], ["Europe/Moscow"]])
+
+    def test_shards_do_not_outnumber_windows(self):
+        habit = self.create_habit(self.tokyo_user, datetime.time(9, 0))
+
+        with mock.patch("habits.tasks.dispatch_due_reminder_shard.s", wraps=dispatch_due_reminder_shard.s) as shard:
+            self.assertEqual(self.run_dispatch(shards=8), [habit.id])
+        self.assertEqual(shard.call_count, 2)
+
+    def test_window_does_not_reach_into_previous_day(self):
+        self.create_habit(self.tokyo_user, datetime.time(23, 55))
+        early = self.create_habit(self.tokyo_user, datetime.time(0, 0))
+        # 15:00:10 UTC — 00:00 в Токио
+        now = datetime.datetime(2025, 7, 19, 15, 0, 10, tzinfo=datetime.timezone.utc)
+
+        self.assertEqual(self.run_dispatch(now), [early.id])
+
+
+class BackfillNextDueDateTestCase(TestCase):
+    def test_matches_per_habit_computation_with_bounded_queries(self):
+        backfill = importlib.import_module("habits.migrations.0002_habit_next_due_date").backfill_next_due_date
+        user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        today = datetime.date(2025, 7, 20)
+        habits = []
+        for i in range(60):
+            habit = Habit.objects.create(
+                user=user,
+                place="Home",
+                time=datetime.time(9, 0),
+                action=f"Action {i}",
+                periodicity=i % 7 + 1,
+                execution_time=30,
+            )
+            created_at = datetime.datetime(2025, 7, 19, 22, tzinfo=datetime.timezone.utc) - datetime.timedelta(days=i)
+            Habit.objects.filter(pk=habit.pk).update(created_at=created_at)
+            habits.append((habit.pk, habit.periodicity, timezone.localdate(created_at)))
+
+        with mock.patch("django.utils.timezone.localdate", return_value=today), CaptureQueriesContext(
+            connection
+        ) as queries:
+            backfill(django_apps, None)
+        # UPDATE для периодичности 1, выборка дней создания и не больше одного UPDATE на остаток по модулю 2..7
+        self.assertLessEqual(len(queries), 2 + sum(range(2, 8)))
+
+        due_dates = dict(Habit.objects.values_list("id", "next_due_date"))
+        for pk, periodicity, created_day in habits:
+            expected = today + datetime.timedelta(days=-(today - created_day).days % periodicity)
+            self.assertEqual(due_dates[pk], expected)
+
+
+class HabitQueryPlanTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(email=f"plan{i}@example.com") for i in range(20)])
+        Habit.objects.bulk_create(
+            [
+                Habit(
+                    user=cls.users[i % 20],
+                    place="Home",
+                    time=datetime.time(i % 24, i % 60),
+                    action=f"Action {i}",
+                    is_pleasant=i % 3 == 0,
+                    periodicity=1,
+                    execution_time=30,
+                    is_public=i % 10 == 0,
+                    next_due_date=datetime.date(2025, 7, 1) + datetime.timedelta(days=i % 30),
+                )
+                for i in range(3000)
+            ]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertNotIn("Seq Scan on habits_habit", plan)
+        for line in plan.splitlines():
+            if line.rstrip().endswith("SCAN habits_habit"):
+                self.fail(f"Полный просмотр таблицы:\n{plan}")
+        if connection.vendor == "sqlite":
+            self.assertIn(index_name, plan)
+
+    def test_own_habits_list_uses_user_index(self):
+        queryset = Habit.objects.filter(user=self.users[0]).order_by("id")[:5]
+        self.assertUsesIndex(queryset, "habit_user_id_idx")
+
+    def test_public_feed_uses_partial_index(self):
+        queryset = Habit.objects.filter(is_public=True).order_by("id")[:5]
+        self.assertUsesIndex(queryset, "habit_public_feed_idx")
+
+    def test_reminder_scan_uses_partial_index(self):
+        queryset = (
+            Habit.objects.reminder_eligible()
+            .due_on(datetime.date(2025, 7, 2))
+            .filter(time__range=(datetime.time(9, 0), datetime.time(9, 15)))
+        )
+        self.assertUsesIndex(queryset, "habit_reminder_due_idx")
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            server.requests.append(json.loads(body))
+            status, payload = server.responses.pop(0) if server.responses else (200, None)
+        if payload is None:
+            payload = {
+                "ok": True,
+                "result": {"message_id": len(server.requests), "date": 0, "chat": {"id": 1, "type": "private"}},
+            }
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_telegram(testcase):
+    """Поднимает FakeTelegramHandler на свободном порту и возвращает сервер и Bot, который в него ходит."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegramHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.responses = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    testcase.addCleanup(server.server_close)
+    testcase.addCleanup(server.shutdown)
+
+    host, port = server.server_address
+    return server, create_bot(token="123:fake", base_url=f"http://{host}:{port}/bot", pool_size=4)
+
+
+class TelegramDeliveryTestCase(TestCase):
+    def setUp(self):
+        self.server, bot = start_fake_telegram(self)
+        self.sleeps = []
+        self.delivery = TelegramDelivery(bot, max_concurrency=4, sleep=self.sleeps.append)
+
+    def test_send_many_delivers_all_messages(self):
+        reminders = [[i, str(i), f"text {i}"] for i in range(10)]
+
+        results = self.delivery.send_many(reminders)
+
+        self.assertEqual(
+            [(result.habit_id, result.error, result.attempts) for result in results], [(i, None, 1) for i in range(10)]
+        )
+        self.assertEqual(sorted(r["text"] for r in self.server.requests), sorted(f"text {i}" for i in range(10)))
+
+    def test_retry_after_is_respected(self):
+        payload = {"ok": False, "error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": 3}}
+        self.server.responses = [(429, payload)]
+
+        with self.assertLogs("habits.delivery", "WARNING"):
+            self.assertIsNone(self.delivery.send("1", "hello"))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertIn(3, self.sleeps)
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.server.responses = [
+            (502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}),
+            (500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}),
+        ]
+
+        with self.assertLogs("habits.delivery", "WARNING"):
+            self.assertIsNone(self.delivery.send("1", "hello"))
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+
+    def test_bad_request_is_not_retried(self):
+        self.server.responses = [(400, {"ok": False, "error_code": 400, "description": "chat not found"})]
+
+        error = self.delivery.send("1", "hello")
+
+        self.assertIsNotNone(error)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.responses = [(502, {"ok": False, "error_code": 502, "description": "Bad Gateway"})] * 5
+
+        with self.assertLogs("habits.delivery", "WARNING"):
+            self.assertIsNotNone(self.delivery.send("1", "hello"))
+        self.assertEqual(len(self.server.requests), 4)
+
+
+class SplitRangeTestCase(TestCase):
+    def test_ranges_cover_interval_without_overlap(self):
+        self.assertEqual(split_range(1, 10, 3), [(1, 4), (5, 8), (9, 10)])
+        self.assertEqual(split_range(5, 6, 4), [(5, 5), (6, 6)])
+        self.assertEqual(split_range(7, 7, 8), [(7, 7)])
+
+
+class TelegramReminderTestCase(TestCase):
+    def setUp(self):
+        self.server, bot = start_fake_telegram(self)
+        delivery = TelegramDelivery(bot, max_concurrency=4, sleep=lambda seconds: None)
+        patcher = mock.patch("habits.tasks.get_delivery", return_value=delivery)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234", telegram_chat_id="100")
+        self.no_chat = User.objects.create_user(email="user2@example.com", password="pass1234")
+        self.today = datetime.date(2025, 7, 20)
+
+    def create_habit(self, user, action="Read book"):
+        return Habit.objects.create(
+            user=user,
+            place="Home",
+            time=datetime.time(9, 0),
+            action=action,
+            execution_time=30,
+            next_due_date=self.today,
+        )
+
+    def test_single_reminder_is_sent_to_user_chat(self):
+        habit = self.create_habit(self.user)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(send_telegram_reminder(self.user.id, habit.id))
+
+        self.assertEqual(
+            self.server.requests,
+            [{"chat_id": "100", "text": "Напоминание: пора выполнить привычку 'Read book' в 09:00 в Home."}],
+        )
+
+    def test_single_reminder_without_chat_id_is_skipped(self):
+        habit = self.create_habit(self.no_chat)
+
+        with self.assertLogs("habits.tasks", "WARNING"):
+            self.assertFalse(send_telegram_reminder(self.no_chat.id, habit.id))
+        self.assertEqual(self.server.requests, [])
+
+    def test_daily_run_delivers_messages(self):
+        habits = [self.create_habit(self.user, f"Action {i}") for i in range(3)]
+        self.create_habit(self.no_chat)
+
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today):
+            schedule_daily_reminders()
+
+        texts = sorted(r["text"] for r in self.server.requests)
+        self.assertEqual(texts, [f"Напоминание: пора выполнить привычку 'Action {i}' в 09:00 в Home." for i in "012"])
+        self.assertEqual({r["chat_id"] for r in self.server.requests}, {"100"})
+        self.assertEqual(
+            sorted(ReminderDelivery.objects.filter(status=ReminderDelivery.SENT).values_list("habit_id", flat=True)),
+            [habit.id for habit in habits],
+        )
+
+    def test_users_without_chat_id_are_filtered_in_sql(self):
+        self.create_habit(self.no_chat)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(iter_due_reminders(self.today)), [])
+        self.assertIn('"users_customuser"."telegram_chat_id" IS NOT NULL', queries[0]["sql"])
+
+    def test_due_dates_advance_for_users_without_chat_id(self):
+        with_chat = self.create_habit(self.user)
+        without_chat = self.create_habit(self.no_chat)
+
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today):
+            schedule_daily_reminders(shards=1)
+
+        next_day = self.today + datetime.timedelta(days=1)
+        with_chat.refresh_from_db()
+        without_chat.refresh_from_db()
+        self.assertEqual((with_chat.next_due_date, without_chat.next_due_date), (next_day, next_day))
+
+
+class TokenBucketTestCase(TestCase):
+    def test_waits_once_burst_is_spent(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2, clock=lambda: now[0])
+
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+        now[0] = 10.0
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_redis_bucket_is_shared_between_workers(self):
+        now = [1000.0]
+        script = fakeredis.FakeStrictRedis().register_script(TOKEN_BUCKET_SCRIPT)
+        workers = [RedisTokenBucket(script, "telegram:bucket:global", rate=2, clock=lambda: now[0]) for _ in range(2)]
+
+        self.assertEqual([workers[i % 2].reserve() for i in range(4)], [0.0, 0.0, 0.5, 1.0])
+        now[0] = 1010.0
+        self.assertEqual(workers[0].reserve(), 0.0)
+
+    def test_redis_bucket_falls_back_to_process_when_redis_is_down(self):
+        script = mock.Mock(side_effect=redis.ConnectionError("down"))
+        bucket = RedisTokenBucket(script, "telegram:bucket:global", rate=2)
+
+        with self.assertLogs("habits.delivery", "WARNING"):
+            self.assertEqual(bucket.reserve(), 0.0)
+
+
+class BenchCommandTestCase(TestCase):
+    def test_reports_json_and_rolls_back(self):
+        out = io.StringIO()
+        call_command("bench", users=3, habits_per_user=4, iterations=2, reminder_runs=1, stats_weeks=3, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["meta"]["habits"], 12)
+        self.assertEqual(
+            set(report["results"]),
+            {
+                "habits.list",
+                "habits.create",
+                "habits.update",
+                "public_feed.cached",
+                "public_feed.cold",
+                "stats.week",
+                "serializer.drf",
+                "serializer.fast",
+                "reminders.due_scan",
+                "send_telegram_reminder",
+                "schedule_daily_reminders",
+            },
+        )
+        for result in report["results"].values():
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertIn("queries_median", result)
+        self.assertFalse(get_user_model().objects.filter(email__startswith="bench-").exists())
+        self.assertFalse(Habit.objects.exists())
+        # Недели истории по каждой привычке пользователя, включая созданные замером habits.create
+        self.assertGreaterEqual(report["results"]["stats.week"]["history_rows"], 4 * 3)
+        self.assertEqual(
+            report["results"]["serializer.fast"]["operations"], report["results"]["serializer.drf"]["operations"]
+        )
+
+
+class ReminderBackpressureTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234", telegram_chat_id="100")
+        self.today = datetime.date(2025, 7, 20)
+
+    @override_settings(REMINDER_QUEUE_MAX_LENGTH=100, REMINDER_BACKPRESSURE_INTERVAL=2)
+    def test_waits_until_queue_drains(self):
+        with mock.patch("habits.tasks.delivery_queue_length", side_effect=[250, 150, 100]), mock.patch(
+            "habits.tasks.time.sleep"
+        ) as sleep:
+            waited = wait_for_delivery_queue()
+
+        self.assertEqual(waited, 4)
+        self.assertEqual(sleep.call_count, 2)
+
+    @override_settings(
+        REMINDER_QUEUE_MAX_LENGTH=100, REMINDER_BACKPRESSURE_INTERVAL=2, REMINDER_BACKPRESSURE_MAX_WAIT=6
+    )
+    def test_gives_up_after_max_wait(self):
+        with mock.patch("habits.tasks.delivery_queue_length", return_value=1000), mock.patch(
+            "habits.tasks.time.sleep"
+        ) as sleep, self.assertLogs("habits.tasks", "WARNING"):
+            waited = wait_for_delivery_queue()
+
+        self.assertEqual(waited, 6)
+        self.assertEqual(sleep.call_count, 3)
+
+    def test_eager_mode_has_no_queue(self):
+        with mock.patch("habits.tasks.time.sleep") as sleep:
+            self.assertEqual(wait_for_delivery_queue(), 0)
+        sleep.assert_not_called()
+
+    @override_settings(REMINDER_BATCH_SIZE=2)
+    def test_dispatch_checks_queue_before_each_batch(self):
+        for i in range(5):
+            Habit.objects.create(
+                user=self.user,
+                place="Home",
+                time=datetime.time(9, 0),
+                action=f"Action {i}",
+                execution_time=30,
+                next_due_date=self.today,
+            )
+
+        with mock.patch("habits.tasks.timezone.localdate", return_value=self.today), mock.patch(
+            "habits.tasks.wait_for_delivery_queue"
+        ) as wait, mock.patch("habits.tasks.send_reminder_batch.delay") as delay:
+            schedule_daily_reminders(shards=1)
+
+        self.assertEqual(delay.call_count, 3)
+        self.assertEqual(wait.call_count, 3)
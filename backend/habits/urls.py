@@ -1,10 +1,21 @@
+from django.conf import settings
 from rest_framework.routers import DefaultRouter
-from .views import HabitViewSet
+from .views import HabitExportView, HabitImportView, HabitStatsView, HabitViewSet
 from django.urls import path, include
 
 router = DefaultRouter()
 router.register(r"habits", HabitViewSet, basename="habits")
 
 urlpatterns = [
+    path("stats/", HabitStatsView.as_view(), name="habit-stats"),
+    path("export/", HabitExportView.as_view(), name="habit-export"),
+    path("import/", HabitImportView.as_view(), name="habit-import"),
     path("", include(router.urls)),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    from .async_views import habit_detail, habit_list
+
+    # В режиме ASGI список и просмотр привычек обслуживаются асинхронно, остальное уходит в HabitViewSet
+    urlpatterns.insert(0, path("habits/", habit_list))
+    urlpatterns.insert(1, path("habits/<int:pk>/", habit_detail))
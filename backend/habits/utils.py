@@ -0,0 +1,13 @@
+from itertools import islice
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def split_range(low, high, parts):
+    """Делит отрезок целых [low, high] на не больше parts непересекающихся отрезков почти равной длины."""
+    size = -(-(high - low + 1) // parts)
+    return [(start, min(start + size - 1, high)) for start in range(low, high + 1, size)]
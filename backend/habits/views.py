@@ -1,37 +1,342 @@
-from rest_framework import viewsets
+import codecs
+import datetime
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import exceptions, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
-from .models import Habit
-from .serializers import HabitSerializer
+from .caching import (
+    bump_public_feed_version,
+    get_public_feed_page,
+    public_feed_etag,
+    public_feed_state,
+    set_public_feed_page,
+)
+from .models import Habit, HabitCompletion, HabitStat
+from .export import aiter_chunks, iter_export_records
+from .importer import HabitImporter, HabitImportError, iter_import_records
+from .renderers import CSVRenderer, NDJSONRenderer, ORJSONRenderer
+from .serializers import (
+    HabitCompletionSerializer,
+    HabitSerializer,
+    HabitStatSerializer,
+    habit_list_columns,
+    linked_habit_queryset,
+    serialize_habit_rows,
+)
 from .permissions import IsOwnerOrReadOnlyPublic
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.authentication import StatelessAuthenticationMixin
 
 
 class HabitPagination(PageNumberPagination):
     page_size = 5
 
 
-class HabitViewSet(viewsets.ModelViewSet):
+class HabitCursorPagination(CursorPagination):
+    page_size = 5
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = "id"
+
+
+class HabitViewSet(StatelessAuthenticationMixin, viewsets.ModelViewSet):
     serializer_class = HabitSerializer
     pagination_class = HabitPagination
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnlyPublic]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    @property
+    def paginator(self):
+        # Курсорная пагинация включается параметром ?pagination=cursor (или наличием ?cursor=),
+        # по умолчанию остаётся постраничная для обратной совместимости.
+        if not hasattr(self, "_paginator"):
+            params = self.request.query_params
+            if params.get("pagination") == "cursor" or "cursor" in params:
+                self._paginator = HabitCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
-        return Habit.objects.all().order_by("id")
+        habits = Habit.objects.all().order_by("id")
+        if self.action != "list":
+            # Часовой пояс владельца нужен для current_streak в ответе — берём его тем же запросом
+            habits = habits.select_related("user")
+        return habits
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
+
+    def get_expand(self, allowed):
+        """Связи из ?expand=linked_habit,user, которые встраиваются в ответ вместо id."""
+        expand = {name for name in self.request.query_params.get("expand", "").split(",") if name}
+        unknown = expand - allowed
+        if unknown:
+            raise exceptions.ValidationError({"expand": [f"Нельзя раскрыть: {', '.join(sorted(unknown))}."]})
+        return expand
 
     def list(self, request, *args, **kwargs):
         if request.query_params.get("public") == "true":
-            queryset = self.get_queryset().filter(is_public=True).order_by("id")
-        else:
-            queryset = self.get_queryset().filter(user=request.user).order_by("id")
+            return self.list_public(request)
 
-        page = self.paginate_queryset(queryset)
+        # Списки только читаются: строки values() сериализуются напрямую, вывод совпадает с HabitSerializer.
+        # Раскрываемые связи выбираются тем же запросом через JOIN.
+        expand = self.get_expand({"linked_habit"})
+        rows = self.get_queryset().filter(user_id=request.user.id).order_by("id").values(*habit_list_columns(expand))
+        page = self.paginate_queryset(rows)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response(serialize_habit_rows(page, expand=expand, user_id=request.user.id))
+        return Response(serialize_habit_rows(rows, expand=expand, user_id=request.user.id))
+
+    def list_public(self, request):
+        # Публичная лента одинакова для всех: страницы кэшируются под версией, которую
+        # сигналы Habit увеличивают при изменениях, а ETag позволяет отвечать 304 без запросов к БД.
+        version = public_feed_state()
+        uri = request.build_absolute_uri()
+        etag = public_feed_etag(version, uri)
+        if etag in request.headers.get("If-None-Match", ""):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        data = get_public_feed_page(version, uri)
+        if data is None:
+            # Страница кэшируется для всех, поэтому в ней раскрываются только публичные связанные привычки
+            expand = self.get_expand({"linked_habit", "user"})
+            rows = self.get_queryset().filter(is_public=True).order_by("id").values(*habit_list_columns(expand))
+            page = self.paginate_queryset(rows)
+            data = self.get_paginated_response(serialize_habit_rows(page, expand=expand)).data
+            set_public_feed_page(version, uri, data)
+        return Response(data, headers={"ETag": etag})
+
+    @action(detail=True, methods=["post"])
+    def complete(self, request, pk=None):
+        habit = self.get_object()
+        # Дата выполнения и проверка «не в будущем» — по календарю владельца, а не сервера
+        today = habit.owner_localdate()
+        serializer = HabitCompletionSerializer(data=request.data, context={"today": today})
+        serializer.is_valid(raise_exception=True)
+        completed_on = serializer.validated_data.get("completed_on") or today
+
+        with transaction.atomic():
+            habit = Habit.objects.select_for_update(of=("self",)).select_related("user").get(pk=habit.pk)
+            if habit.last_completed_on is not None:
+                if completed_on < habit.last_completed_on:
+                    return Response(
+                        {"completed_on": ["Дата раньше последнего выполнения."]}, status=status.HTTP_400_BAD_REQUEST
+                    )
+                if completed_on == habit.last_completed_on:
+                    return Response(self.get_serializer(habit).data)
+            HabitCompletion.objects.create(habit=habit, completed_on=completed_on)
+            habit.register_completion(completed_on)
+            habit.save(update_fields=["current_streak", "longest_streak", "last_completed_on"])
+        return Response(self.get_serializer(habit).data, status=status.HTTP_201_CREATED)
+
+    def get_bulk_items(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return None, Response({"error": "Ожидается список объектов"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.HABIT_BULK_MAX_ITEMS:
+            return None, Response(
+                {"error": f"Не больше {settings.HABIT_BULK_MAX_ITEMS} объектов за запрос"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return items, None
+
+    def get_bulk_context(self, items):
+        """Контекст сериализатора с заранее загруженными (одним запросом) связанными привычками пользователя."""
+        linked_ids = set()
+        for item in items:
+            linked_id = item.get("linked_habit") if isinstance(item, dict) else None
+            if isinstance(linked_id, (int, str)) and str(linked_id).isdigit():
+                linked_ids.add(int(linked_id))
+        linked_habits = linked_habit_queryset(self.request.user).filter(id__in=linked_ids) if linked_ids else []
+        context = self.get_serializer_context()
+        context["linked_habits"] = {habit.id: habit for habit in linked_habits}
+        return context
+
+    @staticmethod
+    def clean_habits(habits, errors):
+        for index, habit in enumerate(habits):
+            if habit is None:
+                continue
+            try:
+                habit.clean()
+            except ValidationError as e:
+                errors[index] = {"non_field_errors": e.messages}
+
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request):
+        items, error_response = self.get_bulk_items(request)
+        if error_response:
+            return error_response
+
+        serializer = self.get_serializer(data=items, many=True, context=self.get_bulk_context(items))
+        serializer.is_valid(raise_exception=True)
+
+        habits = [Habit(user_id=request.user.id, **attrs) for attrs in serializer.validated_data]
+        errors = [{} for _ in habits]
+        self.clean_habits(habits, errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # bulk_create не вызывает save(): дата первого напоминания по календарю владельца, один запрос на пачку
+        if habits:
+            today = habits[0].owner_localdate()
+            for habit in habits:
+                habit.next_due_date = today
+        with transaction.atomic():
+            Habit.objects.bulk_create(habits)
+        if any(habit.is_public for habit in habits):
+            bump_public_feed_version()
+        return Response(self.get_serializer(habits, many=True).data, status=status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        items, error_response = self.get_bulk_items(request)
+        if error_response:
+            return error_response
+
+        ids = [item.get("id") for item in items if isinstance(item, dict)]
+        instances = Habit.objects.filter(user_id=request.user.id, id__in=[i for i in ids if isinstance(i, int)])
+        instances = {habit.id: habit for habit in instances}
+        context = self.get_bulk_context(items)
+
+        habits = []
+        errors = []
+        fields = set()
+        for item in items:
+            habit = instances.get(item.get("id")) if isinstance(item, dict) else None
+            if habit is None:
+                habits.append(None)
+                errors.append({"id": ["Привычка не найдена."]})
+                continue
+            serializer = self.get_serializer(habit, data=item, partial=True, context=context)
+            if serializer.is_valid():
+                for attr, value in serializer.validated_data.items():
+                    setattr(habit, attr, value)
+                fields.update(serializer.validated_data)
+                habits.append(habit)
+                errors.append({})
+            else:
+                habits.append(None)
+                errors.append(serializer.errors)
+        self.clean_habits(habits, errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if fields:
+            with transaction.atomic():
+                Habit.objects.bulk_update(habits, sorted(fields))
+        if any(habit.is_public or getattr(habit, "_was_public", False) for habit in habits):
+            bump_public_feed_version()
+        return Response(self.get_serializer(habits, many=True).data)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request):
+        ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            return Response({"error": "Ожидается список ids"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.HABIT_BULK_MAX_ITEMS:
+            return Response(
+                {"error": f"Не больше {settings.HABIT_BULK_MAX_ITEMS} объектов за запрос"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        with transaction.atomic():
+            Habit.objects.filter(user_id=request.user.id, id__in=ids).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class HabitStatsView(StatelessAuthenticationMixin, APIView):
+    """Статистика выполнения привычек пользователя за неделю или месяц из заранее посчитанных HabitStat."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        period = request.query_params.get("period", HabitStat.WEEK)
+        if period not in (HabitStat.WEEK, HabitStat.MONTH):
+            return Response({"period": ["Допустимо week или month."]}, status=status.HTTP_400_BAD_REQUEST)
+        date = timezone.localdate()
+        if "date" in request.query_params:
+            try:
+                date = datetime.date.fromisoformat(request.query_params["date"])
+            except ValueError:
+                return Response({"date": ["Ожидается дата в формате YYYY-MM-DD."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        period_start = HabitStat.period_start_for(period, date)
+        stats = (
+            HabitStat.objects.filter(user_id=request.user.id, period=period, period_start=period_start)
+            .select_related("habit")
+            .only("habit__action", "habit__periodicity", "days_tracked", "completions", "rolled_up_to")
+            .order_by("habit_id")
+        )
+        stats = list(stats)
+        return Response(
+            {
+                "period": period,
+                "period_start": period_start,
+                "rolled_up_to": max((stat.rolled_up_to for stat in stats), default=None),
+                "habits": HabitStatSerializer(stats, many=True).data,
+            }
+        )
+
+
+class HabitExportView(StatelessAuthenticationMixin, APIView):
+    """Выгрузка всех привычек пользователя с историей выполнений: NDJSON (по умолчанию) или CSV (?format=csv).
+
+    Ответ пишется потоково из серверного курсора, память не зависит от размера аккаунта.
+    Под ASGI поток асинхронный: синхронный Django собрал бы в память целиком.
+    """
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    def get(self, request):
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+        content = renderer.stream(iter_export_records(request.user.id))
+        if isinstance(request._request, ASGIRequest):
+            content = aiter_chunks(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="habits.{renderer.format}"'
+        return response
+
+
+class HabitImportView(StatelessAuthenticationMixin, APIView):
+    """Импорт привычек из тела запроса в формате выгрузки: Content-Type text/csv или application/x-ndjson.
+
+    Тело читается построчно, без загрузки целиком; ответ содержит число созданных привычек и скорость.
+    """
+
+    permission_classes = [IsAuthenticated]
+    formats = {"text/csv": "csv", "application/x-ndjson": "ndjson"}
+
+    def post(self, request):
+        media_type = request.content_type.split(";")[0].strip()
+        if media_type not in self.formats:
+            raise exceptions.UnsupportedMediaType(media_type)
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        lines = codecs.iterdecode(request.stream or [], "utf-8")
+        started = time.perf_counter()
+        try:
+            created = HabitImporter(request.user.id).run(iter_import_records(lines, self.formats[media_type]))
+        except HabitImportError as e:
+            return Response({"errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError:
+            return Response({"errors": ["Ожидается текст в UTF-8"]}, status=status.HTTP_400_BAD_REQUEST)
+        elapsed = time.perf_counter() - started
+        return Response(
+            {"created": created, "seconds": round(elapsed, 3), "rows_per_second": round(created / elapsed, 1)},
+            status=status.HTTP_201_CREATED,
+        )
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+User = get_user_model()
+
+
+def user_active_cache_key(user_id):
+    return f"auth:user-active:{user_id}"
+
+
+def is_user_active(user_id):
+    """Активен ли пользователь; ответ кэшируется на AUTH_USER_CACHE_TIMEOUT секунд."""
+    key = user_active_cache_key(user_id)
+    is_active = cache.get(key)
+    if is_active is None:
+        is_active = User.objects.filter(pk=user_id, is_active=True).exists()
+        cache.set(key, is_active, settings.AUTH_USER_CACHE_TIMEOUT)
+    return is_active
+
+
+class CachedTokenUserAuthentication(JWTStatelessUserAuthentication):
+    """JWT без загрузки пользователя: request.user строится из claims токена (TokenUser).
+
+    Отключённые и удалённые пользователи отсекаются по закэшированному флагу активности.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not is_user_active(user.id):
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
+
+
+class StatelessAuthenticationMixin:
+    """Для представлений, которым от пользователя нужен только id: включается настройкой STATELESS_JWT_AUTH."""
+
+    def get_authenticators(self):
+        if settings.STATELESS_JWT_AUTH:
+            return [CachedTokenUserAuthentication()]
+        return super().get_authenticators()
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 16:41
+
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_alter_customuser_options_alter_customuser_managers_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='timezone',
+            field=models.CharField(default='Europe/Moscow', help_text='Часовой пояс, в котором указано время привычек', max_length=64, validators=[users.models.validate_timezone]),
+        ),
+    ]
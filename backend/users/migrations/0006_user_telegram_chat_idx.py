@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0005_customuser_timezone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(condition=models.Q(('telegram_chat_id__isnull', False)), fields=['id', 'telegram_chat_id'], name='user_telegram_chat_idx'),
+        ),
+    ]
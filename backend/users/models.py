@@ -1,7 +1,23 @@
+import zoneinfo
+
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+DEFAULT_TIMEZONE = "Europe/Moscow"
+
+
+def validate_timezone(value):
+    if value not in zoneinfo.available_timezones():
+        raise ValidationError(f"Неизвестный часовой пояс: {value}")
+
+
+def localdate_in(tz_name):
+    """Сегодняшняя дата в часовом поясе пользователя, а не сервера."""
+    return timezone.localdate(timezone=zoneinfo.ZoneInfo(tz_name or DEFAULT_TIMEZONE))
+
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -27,6 +43,12 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         null=True,
         help_text="Telegram chat ID для отправки уведомлений"
     )
+    timezone = models.CharField(
+        max_length=64,
+        default=DEFAULT_TIMEZONE,
+        validators=[validate_timezone],
+        help_text="Часовой пояс, в котором указано время привычек"
+    )
     is_staff = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
 
@@ -35,5 +57,22 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    class Meta:
+        indexes = [
+            # Рассылка соединяет привычки только с пользователями, у которых есть chat_id
+            models.Index(
+                fields=["id", "telegram_chat_id"],
+                condition=models.Q(telegram_chat_id__isnull=False),
+                name="user_telegram_chat_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Исходный часовой пояс: кэш публичной ленты сбрасывается, только если он изменился
+        instance._was_timezone = instance.__dict__.get("timezone")
+        return instance
+
     def __str__(self):
         return self.email
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -25,3 +26,20 @@ class TelegramChatIdSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["telegram_chat_id"]
+
+
+class TimezoneSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ["timezone"]
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Кладёт в токен поля, нужные CachedTokenUserAuthentication для TokenUser."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["is_staff"] = user.is_staff
+        token["is_active"] = user.is_active
+        return token
@@ -0,0 +1,145 @@
+from unittest import mock
+
+import fakeredis
+import redis
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from users.throttling import SLIDING_WINDOW_SCRIPT, SlidingWindowRateThrottle
+from users.views import TokenObtainView
+
+
+User = get_user_model()
+
+
+class StatelessAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user1@example.com", password="pass1234")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+    def test_user_is_not_loaded_from_database(self):
+        self.client.get(reverse("habits-list"))
+
+        # привычек нет: только COUNT, без SELECT пользователя
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("habits-list"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get(reverse("habits-list")).status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(reverse("habits-list")).status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        self.client.get(reverse("habits-list"))
+        self.user.delete()
+
+        self.assertEqual(self.client.get(reverse("habits-list")).status_code, 401)
+
+    def test_obtained_token_carries_claims(self):
+        response = self.client.post(
+            reverse("token_obtain_pair"), {"email": "user1@example.com", "password": "pass1234"}, format="json"
+        )
+        token = AccessToken(response.data["access"])
+
+        self.assertEqual(token["user_id"], self.user.id)
+        self.assertFalse(token["is_staff"])
+        self.assertTrue(token["is_active"])
+
+
+class SlidingWindowThrottleTestCase(TestCase):
+    rates = {"anon": "3/m", "user": "5/m", "token": "2/m"}
+
+    def setUp(self):
+        self.redis = fakeredis.FakeStrictRedis()
+        self.now = 1000.0
+        patches = [
+            mock.patch(
+                "users.throttling.get_sliding_window_script",
+                return_value=self.redis.register_script(SLIDING_WINDOW_SCRIPT),
+            ),
+            mock.patch.object(SlidingWindowRateThrottle, "THROTTLE_RATES", self.rates),
+            mock.patch.object(SlidingWindowRateThrottle, "timer", lambda throttle: self.now),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.factory = APIRequestFactory()
+        self.view = mock.Mock(spec=[])
+
+    def check(self, user=None, ip="10.0.0.1", view=None):
+        request = Request(self.factory.get("/", REMOTE_ADDR=ip))
+        request.user = user or AnonymousUser()
+        throttle = SlidingWindowRateThrottle()
+        return throttle.allow_request(request, view or self.view), throttle.wait()
+
+    def test_window_slides_instead_of_resetting(self):
+        for offset in (0, 20, 40):
+            self.now = 1000.0 + offset
+            self.assertTrue(self.check()[0])
+
+        self.now = 1050.0
+        allowed, wait = self.check()
+        self.assertFalse(allowed)
+        self.assertEqual(wait, 10)
+
+        # Через минуту после первого запроса освобождается ровно одно место
+        self.now = 1060.0
+        self.assertTrue(self.check()[0])
+        self.assertFalse(self.check()[0])
+
+    def test_rejected_requests_do_not_extend_the_window(self):
+        for _ in range(3):
+            self.check()
+        for _ in range(10):
+            self.assertFalse(self.check()[0])
+
+        self.now = 1060.0
+        self.assertTrue(self.check()[0])
+
+    def test_users_and_addresses_have_separate_limits(self):
+        user = TokenUser({"user_id": 1})
+        other = TokenUser({"user_id": 2})
+
+        self.assertEqual([self.check(user)[0] for _ in range(6)], [True] * 5 + [False])
+        self.assertTrue(self.check(other)[0])
+        self.assertEqual([self.check(ip="10.0.0.2")[0] for _ in range(4)], [True] * 3 + [False])
+        self.assertTrue(self.check(ip="10.0.0.3")[0])
+
+    def test_view_scope_has_its_own_limit(self):
+        view = mock.Mock(throttle_scope="token")
+
+        self.assertEqual([self.check(view=view)[0] for _ in range(3)], [True, True, False])
+        self.assertTrue(self.check()[0])
+
+    def test_requests_pass_when_redis_is_down(self):
+        script = mock.Mock(side_effect=redis.ConnectionError("down"))
+        with mock.patch("users.throttling.get_sliding_window_script", return_value=script), self.assertLogs(
+            "users.throttling", "WARNING"
+        ):
+            self.assertTrue(self.check()[0])
+
+    def test_token_endpoint_returns_429(self):
+        User.objects.create_user(email="user1@example.com", password="pass1234")
+        client = APIClient()
+        data = {"email": "user1@example.com", "password": "wrong"}
+
+        with mock.patch.object(TokenObtainView, "throttle_classes", [SlidingWindowRateThrottle]):
+            statuses = [client.post(reverse("token_obtain_pair"), data, format="json").status_code for _ in range(3)]
+            response = client.post(reverse("token_obtain_pair"), data, format="json")
+
+        self.assertEqual(statuses, [401, 401, 429])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "60")
@@ -0,0 +1,71 @@
+import functools
+import logging
+import secrets
+
+import redis
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] — окно клиента; ARGV: текущее время (мс), длина окна (мс), лимит, уникальный id запроса.
+# Возвращает 0, если запрос пропущен, иначе сколько миллисекунд ждать до освобождения места в окне.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now - window)
+if redis.call("ZCARD", KEYS[1]) < limit then
+    redis.call("ZADD", KEYS[1], now, ARGV[4])
+    redis.call("PEXPIRE", KEYS[1], window)
+    return 0
+end
+local oldest = redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")
+if oldest[2] == nil then
+    return window
+end
+return tonumber(oldest[2]) + window - now
+"""
+
+
+@functools.cache
+def get_sliding_window_script():
+    client = redis.Redis.from_url(settings.THROTTLE_REDIS_URL, socket_timeout=settings.THROTTLE_REDIS_TIMEOUT)
+    # EVALSHA с повтором через EVAL, если Redis ещё не знает скрипт
+    return client.register_script(SLIDING_WINDOW_SCRIPT)
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """Ограничение частоты по скользящему окну в Redis: проверка и учёт запроса — один вызов Lua-скрипта.
+
+    Область лимита берётся из throttle_scope представления, иначе user или anon; лимиты задаются в
+    REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]. Клиент — id пользователя, для анонимных запросов IP.
+    Если Redis недоступен, запрос пропускается.
+    """
+
+    cache_format = "throttle:%(scope)s:%(ident)s"
+
+    def __init__(self):
+        self.wait_ms = 0
+
+    def allow_request(self, request, view):
+        user_id = request.user.id if request.user and request.user.is_authenticated else None
+        self.scope = getattr(view, "throttle_scope", None) or ("user" if user_id is not None else "anon")
+        rate = self.THROTTLE_RATES.get(self.scope)
+        if rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(rate)
+
+        key = self.cache_format % {"scope": self.scope, "ident": user_id or self.get_ident(request)}
+        now_ms = int(self.timer() * 1000)
+        try:
+            self.wait_ms = get_sliding_window_script()(
+                keys=[key], args=[now_ms, self.duration * 1000, self.num_requests, f"{now_ms}:{secrets.token_hex(4)}"]
+            )
+        except redis.RedisError as e:
+            logger.warning("Ограничение частоты пропущено, Redis недоступен: %s", e)
+            return True
+        return self.wait_ms == 0
+
+    def wait(self):
+        return self.wait_ms / 1000
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import TelegramChatIdUpdateView, RegisterView
+from .views import TelegramChatIdUpdateView, RegisterView, TimezoneUpdateView
 
 urlpatterns = [
     path("register/", RegisterView.as_view(), name="register"),
     path("telegram/", TelegramChatIdUpdateView.as_view(), name="telegram-chat-id"),
+    path("timezone/", TimezoneUpdateView.as_view(), name="timezone"),
 ]
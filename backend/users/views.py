@@ -2,9 +2,10 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import RegisterSerializer
+from .serializers import RegisterSerializer, TimezoneSerializer
 from django.contrib.auth import get_user_model
 from rest_framework.generics import CreateAPIView
+from rest_framework_simplejwt.views import TokenObtainPairView
 
 User = get_user_model()
 
@@ -22,10 +23,26 @@ class TelegramChatIdUpdateView(APIView):
         return Response({"message": "Telegram chat ID updated"}, status=status.HTTP_200_OK)
 
 
+class TimezoneUpdateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = TimezoneSerializer(request.user, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({"message": "Timezone updated"}, status=status.HTTP_200_OK)
+
+
 class RegisterView(CreateAPIView):
     serializer_class = RegisterSerializer
+    throttle_scope = "register"
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class TokenObtainView(TokenObtainPairView):
+    # Проверка пароля дорогая, поэтому у выдачи токенов свой лимит
+    throttle_scope = "token"